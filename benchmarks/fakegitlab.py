@@ -0,0 +1,265 @@
+"""A local stand-in for the GitLab REST API.
+
+Serves just enough of the v4 API for ``glt``: groups, subgroups, group
+projects (with offset pagination headers and ``Link`` headers) and project
+creation. Project urls point to bare repositories on the local disk, so
+git operations work without a real GitLab.
+
+Example::
+
+  catalog = Catalog(groups=2, projects=10, repodir='/tmp/repos')
+  server = FakeGitLab(catalog)
+  server.start()
+  print(server.url)
+  ...
+  server.stop()
+"""
+
+import os
+import json
+import threading
+import subprocess
+
+try:
+    from urllib.parse import urlparse, parse_qs, unquote, urlencode
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from urlparse import urlparse, parse_qs
+    from urllib import unquote, urlencode
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+MAX_PER_PAGE = 100
+DEFAULT_PER_PAGE = 20
+STAMP = '2020-01-01T00:00:00.000Z'
+
+
+class Catalog(object):
+    """The groups and projects served
+
+    Every top level group ``group<n>`` gets ``projects`` projects and a
+    chain of ``subgroups`` nested subgroups with ``projects`` projects
+    each. An empty group ``mirror`` serves as sync destination.
+
+    :param groups: number of top level groups
+    :param projects: number of projects per group
+    :param subgroups: depth of the subgroup chain below every group
+    :param repodir: directory holding the bare repositories of the projects
+    :param dstdir: directory in which created projects get their repository
+    """
+
+    def __init__(self, groups=2, projects=10, subgroups=0, repodir='repos',
+                 dstdir='created'):
+        self.repodir = os.path.abspath(repodir)
+        self.dstdir = os.path.abspath(dstdir)
+        self.groups = list()
+        self.projects = list()
+        self.lock = threading.Lock()
+        self.requests = 0
+
+        for number in range(groups):
+            parent = self.add_group('group%d' % number)
+            for _ in range(projects):
+                self.add_project(parent, 'project%d' % len(self.projects_of(parent)),
+                                 self.repodir)
+
+            for depth in range(subgroups):
+                parent = self.add_group('sub%d' % depth, parent)
+                for index in range(projects):
+                    self.add_project(parent, 'project%d' % index, self.repodir)
+
+        self.add_group('mirror')
+
+    def add_group(self, path, parent=None):
+        group = {'id': len(self.groups) + 1,
+                 'name': path,
+                 'path': path,
+                 'full_path': path,
+                 'full_name': path,
+                 'description': '',
+                 'visibility': 'private',
+                 'parent_id': None}
+        if parent is not None:
+            group['full_path'] = parent['full_path'] + '/' + path
+            group['full_name'] = parent['full_name'] + ' / ' + path
+            group['parent_id'] = parent['id']
+        self.groups.append(group)
+        return group
+
+    def add_project(self, group, path, repodir, description=None):
+        url = 'file://%s/%s/%s.git' % (repodir, group['full_path'], path)
+        project = {'id': len(self.projects) + 1,
+                   'name': path,
+                   'path': path,
+                   'description': description or 'project %s' % path,
+                   'path_with_namespace': group['full_path'] + '/' + path,
+                   'name_with_namespace': group['full_name'] + ' / ' + path,
+                   'ssh_url_to_repo': url,
+                   'http_url_to_repo': url,
+                   'web_url': url,
+                   'default_branch': 'master',
+                   'created_at': STAMP,
+                   'last_activity_at': STAMP,
+                   'namespace': {'id': group['id'],
+                                 'name': group['name'],
+                                 'path': group['path'],
+                                 'kind': 'group',
+                                 'full_path': group['full_path'],
+                                 'parent_id': group['parent_id']}}
+        self.projects.append(project)
+        return project
+
+    def group(self, ident):
+        ident = unquote(ident)
+        for group in self.groups:
+            if str(group['id']) == ident or group['full_path'] == ident:
+                return group
+        return None
+
+    def projects_of(self, group):
+        return [x for x in self.projects if x['namespace']['id'] == group['id']]
+
+    def subgroups_of(self, group):
+        return [x for x in self.groups if x['parent_id'] == group['id']]
+
+    def repositories(self):
+        """paths of the bare repositories the projects refer to"""
+        return [os.path.join(self.repodir, x['path_with_namespace'] + '.git')
+                for x in self.projects]
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Request handler, ``catalog`` is set on the server"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def catalog(self):
+        return self.server.catalog
+
+    def send(self, status, body, headers=None):
+        raw = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        for key, value in (headers or dict()).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def paginate(self, items, query):
+        page = int(query.get('page', ['1'])[0])
+        per_page = min(int(query.get('per_page', [DEFAULT_PER_PAGE])[0]), MAX_PER_PAGE)
+        total_pages = max(1, (len(items) + per_page - 1) // per_page)
+        headers = {'X-Total': str(len(items)),
+                   'X-Total-Pages': str(total_pages),
+                   'X-Page': str(page),
+                   'X-Per-Page': str(per_page)}
+
+        if page < total_pages:
+            nextquery = dict((key, value[0]) for key, value in query.items())
+            nextquery['page'] = str(page + 1)
+            headers['X-Next-Page'] = str(page + 1)
+            headers['Link'] = '<http://%s%s?%s>; rel="next"' % (
+                self.headers['Host'], urlparse(self.path).path,
+                urlencode(sorted(nextquery.items())))
+
+        self.send(200, items[(page - 1) * per_page:page * per_page], headers)
+
+    def count(self):
+        with self.catalog.lock:
+            self.catalog.requests += 1
+
+    def do_GET(self):
+        self.count()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.split('/')[3:]
+
+        if parts == ['groups']:
+            items = self.catalog.groups
+            if 'search' in query:
+                term = query['search'][0]
+                items = [x for x in items if term in x['path'] or term in x['name']]
+            return self.paginate(items, query)
+
+        if len(parts) >= 2 and parts[0] == 'groups':
+            group = self.catalog.group(parts[1])
+            if group is None:
+                return self.send(404, {'message': '404 Group Not Found'})
+
+            if len(parts) == 2:
+                return self.send(200, group)
+
+            if parts[2] == 'projects':
+                return self.paginate(self.catalog.projects_of(group), query)
+
+            if parts[2] == 'subgroups':
+                return self.paginate(self.catalog.subgroups_of(group), query)
+
+        return self.send(404, {'message': '404 Not Found'})
+
+    def do_POST(self):
+        self.count()
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+
+        if urlparse(self.path).path.endswith('/projects'):
+            group = self.catalog.group(str(body.get('namespace_id')))
+            if group is None:
+                return self.send(404, {'message': '404 Namespace Not Found'})
+
+            with self.catalog.lock:
+                for project in self.catalog.projects_of(group):
+                    if project['path'] == body['path']:
+                        return self.send(400, {'message': {'name': ['has already been taken']}})
+
+                project = self.catalog.add_project(group, body['path'],
+                                                   self.catalog.dstdir,
+                                                   body.get('description'))
+
+            subprocess.check_call(['git', 'init', '-q', '--bare',
+                                   project['ssh_url_to_repo'][len('file://'):]])
+            return self.send(201, project)
+
+        return self.send(404, {'message': '404 Not Found'})
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeGitLab(object):
+    """Runs the fake API in a background thread
+
+    :param catalog: :class:`Catalog` to serve
+    :param port: port to listen on, 0 picks a free one
+    """
+
+    def __init__(self, catalog, port=0):
+        self.catalog = catalog
+        self.server = Server(('127.0.0.1', port), Handler)
+        self.server.catalog = catalog
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    @property
+    def requests(self):
+        """number of API requests handled so far"""
+        return self.catalog.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,123 @@
+"""Synthetic bare git repositories.
+
+A repository is generated once with ``git fast-import`` and then cloned for
+every project of the fake server. Local clones share the objects through
+hardlinks, so even a few hundred projects take little time and disk space.
+
+Example::
+
+  template = generate('/tmp/template.git', commits=100, files=50, filesize=4096)
+  populate(template, catalog.repositories())
+"""
+
+import os
+import random
+import subprocess
+
+# seed of the content generator, fixed so runs are comparable
+SEED = 42
+AUTHOR = 'Bench Mark <bench@example.com>'
+EPOCH = 1577836800
+
+
+def _blob(rng, size):
+    """printable content of ``size`` bytes"""
+    line = 64
+    chars = 'abcdefghijklmnopqrstuvwxyz0123456789 '
+    lines = [''.join(rng.choice(chars) for _ in range(line - 1))
+             for _ in range(max(1, size // line))]
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+def stream(commits, files, filesize, seed=SEED):
+    """yield the ``git fast-import`` input of a repository
+
+    The first commit adds ``files`` files, every next commit rewrites a
+    few of them. Every tenth commit is tagged.
+
+    :param commits: depth of the history
+    :param files: number of files in the tree
+    :param filesize: size of a file in bytes
+    :param seed: seed of the content generator
+    """
+    rng = random.Random(seed)
+    for number in range(commits):
+        if number == 0:
+            changed = range(files)
+        else:
+            changed = rng.sample(range(files), max(1, files // 10))
+
+        message = ('commit %d\n' % number).encode('ascii')
+        lines = [b'commit refs/heads/master',
+                 b'mark :' + str(number + 1).encode('ascii'),
+                 ('committer %s %d +0000' % (AUTHOR, EPOCH + number * 60)).encode('ascii'),
+                 b'data ' + str(len(message)).encode('ascii'),
+                 message.rstrip(b'\n')]
+        if number > 0:
+            lines.append(b'from :' + str(number).encode('ascii'))
+
+        for index in changed:
+            content = _blob(rng, filesize)
+            lines.append(('M 644 inline src/file%04d.txt' % index).encode('ascii'))
+            lines.append(b'data ' + str(len(content)).encode('ascii'))
+            lines.append(content)
+        yield b'\n'.join(lines) + b'\n'
+
+        if number % 10 == 9:
+            message = ('release %d\n' % number).encode('ascii')
+            yield b'\n'.join([('tag v%d' % (number // 10 + 1)).encode('ascii'),
+                              b'from :' + str(number + 1).encode('ascii'),
+                              ('tagger %s %d +0000' % (AUTHOR, EPOCH + number * 60)).encode('ascii'),
+                              b'data ' + str(len(message)).encode('ascii'),
+                              message]) + b'\n'
+
+
+def generate(path, commits=50, files=20, filesize=4096, seed=SEED):
+    """create a bare repository with a synthetic history
+
+    :param path: location of the repository
+    :param commits: depth of the history
+    :param files: number of files in the tree
+    :param filesize: size of a file in bytes
+    :param seed: seed of the content generator
+    :returns: ``path``
+    """
+    subprocess.check_call(['git', 'init', '-q', '--bare', path])
+    process = subprocess.Popen(['git', '--git-dir=%s' % path, 'fast-import', '--quiet'],
+                               stdin=subprocess.PIPE)
+    try:
+        for chunk in stream(commits, files, filesize, seed):
+            process.stdin.write(chunk)
+    finally:
+        process.stdin.close()
+
+    if process.wait() != 0:
+        raise RuntimeError("git fast-import failed for %s" % path)
+
+    subprocess.check_call(['git', '--git-dir=%s' % path, 'symbolic-ref',
+                           'HEAD', 'refs/heads/master'])
+    return path
+
+
+def populate(template, paths):
+    """clone ``template`` to every path in ``paths``
+
+    :param template: location of the generated repository
+    :param paths: locations of the project repositories
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            continue
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        subprocess.check_call(['git', 'clone', '-q', '--bare', template, path])
+
+
+def size(path):
+    """bytes used by the files below ``path``"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(dirpath, filename))
+    return total
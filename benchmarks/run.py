@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""Time glt commands end to end against a local GitLab stand-in.
+
+Starts :mod:`fakegitlab` on a free port, generates the repositories of its
+projects with :mod:`repos`, and runs ``glt groups``, ``projects``,
+``setup``, ``export`` and ``sync`` as separate processes with a temporary
+``HOME``. Every command is run ``--repeat`` times, the first run is the
+cold one (empty caches, nothing cloned or synced yet). The timings, the
+number of API requests per run and the import time of ``gltools.cli``
+are written as JSON, so results of different commits can be compared::
+
+  python benchmarks/run.py --projects 50 --output before.json
+  git checkout other-branch
+  python benchmarks/run.py --projects 50 --output after.json --compare before.json
+
+The run fails when importing ``gltools.cli`` takes longer than
+``--import-budget`` seconds or loads modules that should only be loaded
+when a command runs.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import repos
+import fakegitlab
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECTION = 'bench'
+
+# modules "import gltools.cli" must not load
+LAZY_MODULES = ['gitlab', 'requests', 'yaml', 'gltools.main']
+
+IMPORT_CHECK = """
+import sys, time, json
+start = time.time()
+import gltools.cli
+seconds = time.time() - start
+print(json.dumps({'seconds': seconds,
+                  'loaded': [x for x in %r if x in sys.modules]}))
+""" % LAZY_MODULES
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def commit():
+    """the commit and whether the tree has local changes"""
+    try:
+        rev = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=TOPDIR)
+        status = subprocess.check_output(['git', 'status', '--porcelain',
+                                          '--untracked-files=no'], cwd=TOPDIR)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return rev.decode('ascii').strip(), bool(status.strip())
+
+
+def environment(home):
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['PYTHONPATH'] = os.pathsep.join([TOPDIR] + [x for x in [env.get('PYTHONPATH')] if x])
+    env.pop('GIT_DIR', None)
+    return env
+
+
+def configure(home, url, workdir):
+    """write the python-gitlab and gltools configuration to ``home``"""
+    os.makedirs(home)
+    with open(os.path.join(home, '.python-gitlab.cfg'), 'w') as handle:
+        handle.write("[global]\ndefault = %s\ntimeout = 60\n\n"
+                     "[%s]\nurl = %s\nprivate_token = bench\napi_version = 4\n"
+                     % (SECTION, SECTION, url))
+
+    with open(os.path.join(home, '.gltools.cfg'), 'w') as handle:
+        handle.write("---\n%s:\n  default:\n" % SECTION)
+        for option in ['projectdir', 'exportdir', 'tempdir', 'mirrordir', 'cachedir']:
+            handle.write("    %s: %s\n" % (option, os.path.join(workdir, option)))
+
+
+def commands(args, workdir):
+    """the benchmarks as (name, arguments) in the order they run"""
+    group = 'group0'
+    recursive = ['-r'] if args.subgroups else []
+    jobs = ['-j', str(args.jobs)]
+    return [
+        ('groups', ['groups', '-t', '--refresh']),
+        ('groups-cached', ['groups', '-t']),
+        ('projects', ['projects', '-t', '--refresh'] + recursive + [group]),
+        ('projects-cached', ['projects', '-t'] + recursive + [group]),
+        ('setup', ['setup'] + jobs + recursive +
+         ['-w', os.path.join(workdir, 'workspace'), group]),
+        ('export', ['export', '-b'] + jobs + recursive +
+         ['-o', os.path.join(workdir, 'export'), group]),
+        ('sync', ['sync'] + jobs + [group, 'mirror']),
+        ('sync-full', ['sync', '--full'] + jobs + [group, 'mirror']),
+    ]
+
+
+def measure(server, argv, env, logfile):
+    """run glt once
+
+    :returns: seconds, API requests and exit status
+    :rtype: dict
+    """
+    command = [sys.executable, '-c', 'from gltools.cli import cli; cli()'] + argv
+    before = server.requests
+    start = time.time()
+    with open(logfile, 'ab') as handle:
+        handle.write(('$ glt %s\n' % ' '.join(argv)).encode('utf-8'))
+        handle.flush()
+        status = subprocess.call(command, env=env, cwd=TOPDIR,
+                                 stdout=handle, stderr=subprocess.STDOUT)
+    return {'seconds': round(time.time() - start, 4),
+            'requests': server.requests - before,
+            'status': status}
+
+
+def import_time(env, repeat):
+    """the fastest of ``repeat`` imports of gltools.cli"""
+    results = list()
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_CHECK],
+                                         env=env, cwd=TOPDIR)
+        results.append(json.loads(output.decode('utf-8')))
+    best = min(results, key=lambda x: x['seconds'])
+    best['seconds'] = round(best['seconds'], 4)
+    return best
+
+
+def compare(results, previous):
+    """print the median timings of ``results`` next to ``previous``"""
+    print("%-16s %10s %10s %8s" % ('benchmark', 'before', 'after', 'change'))
+    rows = [('import', previous.get('import', {}).get('seconds'),
+             results['import']['seconds'])]
+    for name in sorted(results['benchmarks']):
+        old = previous.get('benchmarks', {}).get(name, {}).get('median')
+        rows.append((name, old, results['benchmarks'][name]['median']))
+
+    for name, old, new in rows:
+        if old:
+            print("%-16s %10.3f %10.3f %+7.1f%%" % (name, old, new, (new - old) * 100.0 / old))
+        else:
+            print("%-16s %10s %10.3f %8s" % (name, '-', new, '-'))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--groups', type=int, default=2, help="top level groups")
+    parser.add_argument('--projects', type=int, default=20, help="projects per group")
+    parser.add_argument('--subgroups', type=int, default=0,
+                        help="depth of the subgroup chain below every group")
+    parser.add_argument('--commits', type=int, default=50, help="history depth of a repository")
+    parser.add_argument('--files', type=int, default=20, help="files in a repository")
+    parser.add_argument('--filesize', type=int, default=4096, help="bytes per file")
+    parser.add_argument('--jobs', type=int, default=4, help="value of glt --jobs")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark")
+    parser.add_argument('--only', action='append', metavar='NAME',
+                        help="run only this benchmark, may be repeated")
+    parser.add_argument('--import-budget', type=float, default=0.5,
+                        help="maximum seconds for importing gltools.cli")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', metavar='JSON', help="compare with earlier results")
+    parser.add_argument('--workdir', help="directory to work in (default: a temporary one)")
+    parser.add_argument('--keep', action='store_true', help="keep the work directory")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='gltools-bench.'))
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+
+    catalog = fakegitlab.Catalog(groups=args.groups, projects=args.projects,
+                                 subgroups=args.subgroups,
+                                 repodir=os.path.join(workdir, 'repos'),
+                                 dstdir=os.path.join(workdir, 'created'))
+    server = fakegitlab.FakeGitLab(catalog)
+    server.start()
+
+    try:
+        start = time.time()
+        template = repos.generate(os.path.join(workdir, 'template.git'),
+                                  commits=args.commits, files=args.files,
+                                  filesize=args.filesize)
+        repos.populate(template, catalog.repositories())
+        sys.stderr.write("generated %d repositories of %d bytes in %.1fs\n" %
+                         (len(catalog.projects), repos.size(template),
+                          time.time() - start))
+
+        home = os.path.join(workdir, 'home')
+        configure(home, server.url, workdir)
+        env = environment(home)
+        logfile = os.path.join(workdir, 'glt.log')
+
+        rev, dirty = commit()
+        results = {'commit': rev,
+                   'dirty': dirty,
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                   'parameters': dict((key, value) for key, value in vars(args).items()
+                                      if key not in ('output', 'compare', 'workdir', 'keep')),
+                   'import': import_time(env, args.repeat),
+                   'benchmarks': dict()}
+
+        for name, argv in commands(args, workdir):
+            if args.only and name not in args.only:
+                continue
+            runs = [measure(server, argv, env, logfile) for _ in range(args.repeat)]
+            seconds = [x['seconds'] for x in runs]
+            results['benchmarks'][name] = {'command': ['glt'] + argv,
+                                           'runs': runs,
+                                           'min': min(seconds),
+                                           'median': median(seconds),
+                                           'failed': sum(1 for x in runs if x['status'])}
+            sys.stderr.write("%-16s median %.3fs, %d requests per run%s\n" %
+                             (name, median(seconds), runs[-1]['requests'],
+                              ", %d failed" % results['benchmarks'][name]['failed']
+                              if results['benchmarks'][name]['failed'] else ''))
+
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            sys.stderr.write("work directory kept in %s\n" % workdir)
+
+    if args.output:
+        dirname = os.path.dirname(os.path.abspath(args.output))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+            handle.write('\n')
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as handle:
+            compare(results, json.load(handle))
+
+    errors = list()
+    if results['import']['loaded']:
+        errors.append("importing gltools.cli loads %s" % ", ".join(results['import']['loaded']))
+    if results['import']['seconds'] > args.import_budget:
+        errors.append("importing gltools.cli takes %.3fs, budget is %.3fs" %
+                      (results['import']['seconds'], args.import_budget))
+    if any(x['failed'] for x in results['benchmarks'].values()):
+        errors.append("some glt runs failed, see the glt.log in the work directory (--keep)")
+
+    for error in errors:
+        sys.stderr.write("error: %s\n" % error)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""Chains of incremental git bundles.
+
+An incremental export of a project is a directory with a full bundle, the
+bundles with the commits added since each previous export, and a
+``manifest.json`` describing the chain::
+
+  role-common.bundles/
+    manifest.json
+    role-common-0001-full.bundle
+    role-common-0002-incremental.bundle
+    role-common-0003-incremental.bundle
+
+The manifest is also the state of the export: the tip of its last bundle
+is the basis of the next one. After ``chain`` incremental bundles, or when
+the history was rewritten, a new full bundle starts a new chain and the
+bundles of the old chain are removed. Sequence numbers keep counting, so a
+new bundle never has the name of one shipped before.
+
+Example manifest::
+
+  {
+    "project": "homenet/role-common",
+    "ref": "master",
+    "sequence": 3,
+    "bundles": [
+      {"file": "role-common-0001-full.bundle", "type": "full",
+       "basis": null, "tip": "9fceb02...", "created": "2020-01-01T02:00:00Z",
+       "size": 1048576, "sha256": "..."},
+      {"file": "role-common-0002-incremental.bundle", "type": "incremental",
+       "basis": "9fceb02...", "tip": "d670460...", ...}
+    ]
+  }
+
+Example::
+
+  from gltools.bundlechain import BundleChain
+
+  chain = BundleChain('/exports/homenet/role-common.bundles', 'role-common')
+  print(chain.tip)
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+
+log = logging.getLogger('gltools.bundlechain')
+
+MANIFEST = 'manifest.json'
+
+FULL = 'full'
+INCREMENTAL = 'incremental'
+
+
+def sha256(path):
+    """hex sha256 of the file at ``path``"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for block in iter(lambda: stream.read(1048576), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BundleChain(object):
+    """The bundles of a single project
+
+    :param directory: directory holding the bundles and the manifest
+    :param name: prefix of the bundle file names, e.g. the project path
+    :param project: description of the project stored in the manifest
+    :param ref: the ref that is bundled
+    """
+
+    def __init__(self, directory, name, project=None, ref='master'):
+        self.directory = directory
+        self.name = name
+        self.project = project
+        self.ref = ref
+        self.sequence = 0
+        self.bundles = list()
+        self.load()
+
+    @property
+    def manifest(self):
+        """full path of the manifest"""
+        return os.path.join(self.directory, MANIFEST)
+
+    def load(self):
+        """load the manifest, a missing or unreadable manifest means an
+        empty chain"""
+        if not os.path.exists(self.manifest):
+            return
+
+        try:
+            with open(self.manifest) as stream:
+                data = json.load(stream)
+
+        except (IOError, ValueError) as err:
+            log.warning("ignoring manifest %s: %s" % (self.manifest, err))
+            return
+
+        if data.get('ref') != self.ref:
+            log.warning("%s describes %s, not %s, starting a new chain" %
+                        (self.manifest, data.get('ref'), self.ref))
+        else:
+            self.bundles = data.get('bundles', list())
+        self.sequence = data.get('sequence', 0)
+
+    def save(self):
+        """write the manifest"""
+        data = {'project': self.project,
+                'ref': self.ref,
+                'sequence': self.sequence,
+                'bundles': self.bundles}
+
+        tmpfile = self.manifest + '.tmp'
+        with open(tmpfile, 'w') as stream:
+            json.dump(data, stream, indent=2, sort_keys=True)
+        os.rename(tmpfile, self.manifest)
+        log.debug("wrote %s" % self.manifest)
+
+    @property
+    def tip(self):
+        """the commit the last bundle ends at, None for an empty chain"""
+        if not self.bundles:
+            return None
+        return self.bundles[-1]['tip']
+
+    @property
+    def increments(self):
+        """number of incremental bundles since the last full one"""
+        return len([x for x in self.bundles if x['type'] == INCREMENTAL])
+
+    def filename(self, kind):
+        """file name of the next bundle of type ``kind``"""
+        return "%s-%04d-%s.bundle" % (self.name, self.sequence + 1, kind)
+
+    def add(self, filename, kind, basis, tip):
+        """add a bundle written to ``filename`` in the directory and save the
+        manifest
+
+        A full bundle starts a new chain, the bundles of the previous chain
+        are removed once the manifest is saved.
+
+        :param filename: name of the bundle file
+        :param kind: ``full`` or ``incremental``
+        :param basis: commit the bundle requires, None for a full bundle
+        :param tip: commit the bundle ends at
+        """
+        path = os.path.join(self.directory, filename)
+        entry = {'file': filename,
+                 'type': kind,
+                 'basis': basis,
+                 'tip': tip,
+                 'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                 'size': os.path.getsize(path),
+                 'sha256': sha256(path)}
+
+        obsolete = list()
+        if kind == FULL:
+            obsolete = [x['file'] for x in self.bundles]
+            self.bundles = list()
+
+        self.bundles.append(entry)
+        self.sequence += 1
+        self.save()
+
+        for filename in obsolete:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+
+            except OSError as err:
+                log.warning("failed to remove %s: %s" % (filename, err))
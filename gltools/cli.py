@@ -7,9 +7,12 @@ import os.path
 import logging
 import click
 from gltools.exceptions import GLToolsException, GLToolsConfigException
-from gltools.main import ExportGroup, WorkOnGroup, SyncGroup, ListProjects, ListGroups, InitConfig, SyncGroupLocal
 from gltools.version import __version__
-from gltools.localgitlab import GitLabConfig
+from gltools.workers import ProjectLogFilter
+
+# gltools.main and gltools.localgitlab pull in gitlab, requests and yaml;
+# they are only imported once a command actually runs so ``--help``,
+# ``--version`` and shell completion stay fast.
 
 class State(object):
     """Maintain logging level."""
@@ -18,8 +21,9 @@ class State(object):
         self.logger = logging.getLogger(log_name)
         self.logger.propagate = False
         stream = logging.StreamHandler()
-        formatter = logging.Formatter("%(levelname)s %(funcName)s:  %(message)s")
+        formatter = logging.Formatter("%(levelname)s %(funcName)s:  %(project)s%(message)s")
         stream.setFormatter(formatter)
+        stream.addFilter(ProjectLogFilter())
         self.logger.addHandler(stream)
 
         self.logger.setLevel(level)
@@ -27,11 +31,27 @@ class State(object):
 # pylint: disable=C0103
 pass_state = click.make_pass_decorator(State, ensure=True)
 
+def trace_api(ctx, path=None):
+    """trace the API requests of the command, the summary is logged and the
+    trace written to ``path`` when the command ends"""
+    from gltools import tracing
+    tracer = tracing.start()
+
+    def report():
+        tracer.report()
+        if path:
+            tracer.dump(path)
+        tracing.stop()
+    ctx.call_on_close(report)
+
 def verbose_option(f):
     def callback(ctx, param, value):
         state = ctx.ensure_object(State)
         if value:
             state.logger.setLevel(logging.DEBUG)
+            from gltools import tracing
+            if tracing.current() is None:
+                trace_api(ctx)
     return click.option('-v', '--verbose',
                         is_flag=True,
                         expose_value=False,
@@ -56,21 +76,33 @@ def verbosity_options(f):
 
 # attempt to get a default from the config
 DEFAULT_GITLAB_SECTION = 'local'
-GITLAB_CONFIGS = list()
 
-try:
-    glc = GitLabConfig()
-    DEFAULT_GITLAB_SECTION = glc.default
-    GITLAB_CONFIGS = glc.configs
-except GLToolsConfigException:
-    pass
+_default_section = list()
+
+def default_gitlab_section():
+    """return the default section of the python-gitlab configuration
+
+    The configuration is only read when a command needs the default, and
+    only once.
+    """
+    if not _default_section:
+        section = DEFAULT_GITLAB_SECTION
+        try:
+            from gltools.localgitlab import GitLabConfig
+            section = GitLabConfig().default
+
+        except (GLToolsException, GLToolsConfigException):
+            pass
+
+        _default_section.append(section)
+    return _default_section[0]
 
 
 gitlab_opt = click.option('--gitlab', '-g', 'gitlab_config_section',
                           help="which configuration section should be used" +
-                          " (default: %s)" % DEFAULT_GITLAB_SECTION,
+                          " (default: the default of ~/.python-gitlab.cfg)",
                           metavar="GITLABSECTION",
-                          default=DEFAULT_GITLAB_SECTION)
+                          default=default_gitlab_section)
 
 
 # base options for all
@@ -88,40 +120,74 @@ output_options = [
         )
 ]
 
+# options that effect the use of the local metadata cache
+cache_options = [
+    click.option('--refresh', 'refresh', is_flag=True, default=False,
+        help="ignore the local metadata cache and query the server"),
+    click.option('--offline', 'offline', is_flag=True, default=False,
+        help="only use the local metadata cache, regardless of its age")
+]
+
+# options that effect concurrency
+jobs_options = [
+    click.option('--jobs', '-j', 'jobs', type=click.IntRange(1, None), default=1,
+        help="number of projects processed concurrently (default: 1)")
+]
+
+# options that effect which projects are included
+recursive_opt = click.option('--recursive', '-r', 'recursive', is_flag=True, default=False,
+                             help="include the projects of all subgroups")
+
+# options that effect reporting on the run
+metrics_opt = click.option('--metrics', 'metrics', metavar='FILE',
+                           help="write Prometheus metrics of the run to FILE (textfile collector format)")
+
 # export specific options
-export_options = base_options + output_options + [
+export_options = base_options + output_options + cache_options + jobs_options + [recursive_opt, metrics_opt] + [
     click.option('-b', '--bundles', 'bundles', is_flag=True, default=False, help="export to bundles"),
+    click.option('-i', '--incremental', 'incremental', is_flag=True, default=False,
+        help="export to chains of incremental bundles (implies --bundles)"),
     click.option('--outputdir', '-o', 'outputdir', help="where the export shut be put")
 ]
 
 # setup specific options
-setup_options = base_options + output_options + [
+setup_options = base_options + output_options + cache_options + jobs_options + [recursive_opt, metrics_opt] + [
     click.option('--workdir', '-w', 'workdir', help="where the group should be maintained")
 ]
 
+# options that effect concurrency of the sync stages
+sync_jobs_options = jobs_options + [
+    click.option('--push-jobs', '-J', 'push_jobs', type=click.IntRange(1, None),
+        help="number of projects pushed concurrently (default: same as --jobs)")
+]
+
+# options that effect which projects are synced
+full_opt = click.option('--full', 'full', is_flag=True, default=False,
+                        help="sync all projects, also the ones unchanged since the last sync")
+
 # sync options
-sync_options = base_options + [
+sync_options = base_options + sync_jobs_options + [full_opt, metrics_opt] + [
     click.argument('dstgroupname', nargs=1, required=True, type=str, metavar='DESTGROUPNAME'),
     click.option('--dest-gitlab', '-G', 'dst_gitlab_config_section',
                               help="which configuration section should be used" +
                               " as destination for sync" +
-                              " (default: %s)" % DEFAULT_GITLAB_SECTION,
+                              " (default: the default of ~/.python-gitlab.cfg)",
                               metavar="DESTGITLABSECTION",
-                              default=DEFAULT_GITLAB_SECTION)
+                              default=default_gitlab_section)
 ]
 
 # sync local options
-sync_local_options = base_options + [
+sync_local_options = base_options + jobs_options + [full_opt, recursive_opt, metrics_opt] + [
     click.argument('dstdirectory', nargs=1, required=True, type=str, default=os.path.expanduser('~'), metavar='DESTDIR')
 ]
 
 # groups options
-groups_options = [gitlab_opt] + [
+groups_options = [gitlab_opt] + cache_options + [
     click.option('--terse', '-t', 'terse', is_flag=True, default=False, help="terse output in command"),
 ]
 
 # projects options
-projects_options = base_options + output_options + [
+projects_options = base_options + output_options + cache_options + [recursive_opt] + [
     click.option('--terse', '-t', 'terse', is_flag=True, default=False, help="terse output in command"),
 ]
 
@@ -140,13 +206,48 @@ def add_options(options):
         return func
     return _add_options
 
+def run_command(classname, **kwargs):
+    """create an instance of ``classname`` from :mod:`gltools.main` and run it
+
+    :param classname: name of the class, e.g. ``ExportGroup``
+    :param kwargs: the command line options
+    """
+    try:
+        import gltools.main
+        glt_obj = getattr(gltools.main, classname)(**kwargs)
+        glt_obj.main()
+
+    except GLToolsException as exp:
+        raise SystemExit("\n" + str(exp))
+
+# options that effect profiling and tracing, they apply to any command
+profile_options = [
+    click.option('--profile', 'profile', metavar='FILE',
+        help="profile the command, write the statistics to FILE (.pstats) and print a summary"),
+    click.option('--profile-top', 'profile_top', type=click.IntRange(1, None), default=20,
+        help="number of functions listed in the profile summary (default: 20)"),
+    click.option('--profile-memory', 'profile_memory', is_flag=True, default=False,
+        help="also trace memory allocations while profiling (python 3)"),
+    click.option('--trace', 'trace', metavar='FILE',
+        help="write every API request to FILE (JSON lines) and log a summary per endpoint")
+]
+
 @click.group(context_settings={'help_option_names': ['-h', '--help']})
 @click.version_option(__version__, '-V', '--version')
-def cli():
+@add_options(profile_options)
+@click.pass_context
+def cli(ctx, profile, profile_top, profile_memory, trace):
     """
     GitLab tools
     """
-    pass
+    if trace:
+        trace_api(ctx, trace)
+
+    if profile:
+        from gltools.profiling import Profiler
+        profiler = Profiler(profile, top=profile_top, memory=profile_memory)
+        profiler.start()
+        ctx.call_on_close(profiler.stop)
 
 
 @cli.command(name="export")
@@ -154,12 +255,7 @@ def cli():
 @verbosity_options
 def export(**kwargs):
     """Export the latest version of the projects"""
-    try:
-        glt_obj = ExportGroup(**kwargs)
-        glt_obj.main()
-
-    except GLToolsException as exp:
-        raise SystemExit("\n" + str(exp))
+    run_command("ExportGroup", **kwargs)
 
 
 @cli.command(name="setup")
@@ -167,12 +263,7 @@ def export(**kwargs):
 @verbosity_options
 def setup_wd(**kwargs):
     """Setup or update local clones of the group"""
-    try:
-        glt_obj = WorkOnGroup(**kwargs)
-        glt_obj.main()
-
-    except GLToolsException as exp:
-        raise SystemExit("\n" + str(exp))
+    run_command("WorkOnGroup", **kwargs)
 
 
 @cli.command(name="sync")
@@ -180,59 +271,33 @@ def setup_wd(**kwargs):
 @verbosity_options
 def sync(**kwargs):
     """Sync one GitLab group to another."""
-    try:
-        glt_obj = SyncGroup(**kwargs)
-        glt_obj.main()
-
-    except GLToolsException as exp:
-        raise SystemExit("\n" + str(exp))
+    run_command("SyncGroup", **kwargs)
 
 @cli.command(name="synclocal")
 @add_options(sync_local_options)
 @verbosity_options
 def sync(**kwargs):
     """Sync one GitLab group to a local archive."""
-    try:
-        glt_obj = SyncGroupLocal(**kwargs)
-        glt_obj.main()
-
-    except GLToolsException as exp:
-        raise SystemExit("\n" + str(exp))
+    run_command("SyncGroupLocal", **kwargs)
 
 @cli.command(name="groups")
 @add_options(groups_options)
 @verbosity_options
 def groups(**kwargs):
     """list groups on the server"""
-    try:
-        glt_obj = ListGroups(**kwargs)
-        glt_obj.main()
-
-    except GLToolsException as exp:
-        raise SystemExit("\n" + str(exp))
+    run_command("ListGroups", **kwargs)
 
 @cli.command(name="projects")
 @add_options(projects_options)
 @verbosity_options
 def projects(**kwargs):
     """list projects in the selected group"""
-    try:
-        glt_obj = ListProjects(**kwargs)
-        glt_obj.main()
-
-    except GLToolsException as exp:
-        raise SystemExit("\n" + str(exp))
+    run_command("ListProjects", **kwargs)
 
 @cli.command(name="init")
 @add_options([gitlab_opt])
 @verbosity_options
 def init_gitlab_config(**kwargs):
     """initialize the local gitlab config"""
-
-    try:
-        glt_obj = InitConfig(**kwargs)
-        glt_obj.main()
-
-    except GLToolsException as exp:
-        raise SystemExit("\n" + str(exp))
+    run_command("InitConfig", **kwargs)
 
@@ -52,6 +52,11 @@ class GitLabToolsConfig(object):
           projectdir: /scratch/jvzantvoort
           exportdir: /scratch/jvzantvoort/exports
           tempdir: /scratch/jvzantvoort/temp
+          mirrordir: /scratch/jvzantvoort/mirrors
+          cachettl: 600
+          timeout: 1800
+          ratelimit: 10
+          bundlechain: 7
         common:
           protected: true
 
@@ -72,6 +77,12 @@ class GitLabToolsConfig(object):
         self._defaults = {'projectdir': os.path.expanduser('~/Workspace'),
                           'exportdir': os.path.expanduser('~/exports'),
                           'tempdir': os.path.expanduser('~/tmp'),
+                          'mirrordir': os.path.expanduser('~/.cache/gltools/mirrors'),
+                          'cachedir': os.path.expanduser('~/.cache/gltools'),
+                          'cachettl': 3600,
+                          'timeout': 0,
+                          'ratelimit': 0,
+                          'bundlechain': 7,
                           'protected': False}
 
 
@@ -137,6 +148,36 @@ class GitLabToolsConfig(object):
     def tempdir(self):
         return self.config.get('tempdir')
 
+    @property
+    def mirrordir(self):
+        return os.path.expanduser(self.config.get('mirrordir'))
+
+    @property
+    def cachedir(self):
+        return os.path.expanduser(self.config.get('cachedir'))
+
+    @property
+    def cachettl(self):
+        return int(self.config.get('cachettl'))
+
+    @property
+    def timeout(self):
+        """seconds after which a single git (or other external) command is
+        killed, None means no limit"""
+        return int(self.config.get('timeout') or 0) or None
+
+    @property
+    def ratelimit(self):
+        """maximum number of API requests per second to the server, None
+        means only the limits announced by the server are followed"""
+        return float(self.config.get('ratelimit') or 0) or None
+
+    @property
+    def bundlechain(self):
+        """number of incremental bundles an incremental export makes after a
+        full bundle before it makes the next full one"""
+        return int(self.config.get('bundlechain') or 0)
+
     @property
     def mask(self):
         return self.config.get('mask')
@@ -0,0 +1,363 @@
+"""Process wide registry of GitLab connections.
+
+Every configuration section gets a single ``gitlab.Gitlab`` instance,
+created on first use and shared by all classes and worker threads. Its
+``requests`` session keeps connections alive and has a connection pool
+large enough for the concurrent page fetches and workers, so TLS
+handshakes are paid once per connection instead of once per object.
+
+All requests pass a :class:`SchedulingAdapter`, which paces them with a
+token bucket per server and retries the ones the server could not handle:
+
+* the bucket follows the ``RateLimit-*`` headers of the server and, if
+  set, the ``ratelimit`` option in ``~/.gltools.cfg``
+* a ``429 Too Many Requests`` pauses all requests to the server for the
+  ``Retry-After`` time and is retried, whatever the method
+* server errors (500, 502, 503, 504) and connection errors are retried
+  with jittered exponential backoff, for idempotent methods only
+
+The adapter is the only layer that retries: the connections are
+:class:`GitLab` instances, which switch off the retries python-gitlab
+does on its own.
+
+While tracing is on (see :mod:`gltools.tracing`) the adapter records every
+request it sends, retries included.
+
+Example::
+
+  from gltools.connections import connection
+
+  gl = connection('local')
+  gl.groups.get('homenet')
+"""
+
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_tz, mktime_tz
+
+from gltools.exceptions import GLToolsException
+from gltools import tracing
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+try:
+    import gitlab
+    import requests
+    from requests.adapters import HTTPAdapter
+
+except ImportError:
+    raise GLToolsException('python-gitlab module not available')
+
+log = logging.getLogger('gltools.connections')
+
+# number of connections kept open per host
+POOL_SIZE = 16
+
+# retries of a single request and the backoff before the first retry
+MAX_RETRIES = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 60
+
+# methods that can safely be sent again after a server or connection error
+IDEMPOTENT = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUS = frozenset([500, 502, 503, 504])
+
+# GitLab reports its limits per period of a minute
+RATELIMIT_PERIOD = 60.0
+
+_lock = threading.Lock()
+_connections = dict()
+_buckets = dict()
+_requests = dict()
+_requestlock = threading.Lock()
+
+
+class TokenBucket(object):
+    """Paces the requests to a single server
+
+    :param rate: requests per second, None for no limit of our own
+    :param burst: requests allowed in a burst
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self.limit = rate
+        self.rate = rate
+        self.burst = float(burst or max(1, rate or 1))
+        self.tokens = self.burst
+        self.stamp = time.time()
+        self.paused = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """wait until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.time()
+                wait = self.paused - now
+                if wait <= 0:
+                    if self.rate is None:
+                        return
+
+                    self.tokens = min(self.burst,
+                                      self.tokens + (now - self.stamp) * self.rate)
+                    self.stamp = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """hold all requests for ``seconds``"""
+        with self._lock:
+            self.paused = max(self.paused, time.time() + seconds)
+
+    def update(self, headers):
+        """follow the ``RateLimit-*`` headers of a response
+
+        The rate is the lowest of the configured rate, the limit of the
+        server and what is left of the current period spread over the time
+        until it resets.
+        """
+        try:
+            limit = int(headers.get('RateLimit-Limit') or 0)
+            remaining = headers.get('RateLimit-Remaining')
+            if remaining is not None:
+                remaining = int(remaining)
+            reset = float(headers.get('RateLimit-Reset') or 0)
+
+        except ValueError:
+            return
+
+        if not limit:
+            return
+
+        rates = [limit / RATELIMIT_PERIOD]
+        if self.limit:
+            rates.append(self.limit)
+
+        if remaining is not None and reset:
+            if remaining <= 0:
+                self.pause(reset - time.time())
+            else:
+                rates.append(remaining / max(reset - time.time(), 1.0))
+
+        with self._lock:
+            # allow bursts of a second worth of requests
+            self.rate = max(min(rates), 0.1)
+            self.burst = max(1.0, self.rate)
+            self.tokens = min(self.tokens, self.burst)
+
+
+def retry_after(headers):
+    """seconds to wait according to ``Retry-After`` or ``RateLimit-Reset``
+
+    :rtype: float or None
+    """
+    value = headers.get('Retry-After')
+    if value:
+        try:
+            return max(float(value), 0)
+
+        except ValueError:
+            parsed = parsedate_tz(value)
+            if parsed is not None:
+                return max(mktime_tz(parsed) - time.time(), 0)
+
+    reset = headers.get('RateLimit-Reset')
+    if reset:
+        try:
+            return max(float(reset) - time.time(), 0)
+
+        except ValueError:
+            pass
+    return None
+
+
+def body_size(response, stream=False):
+    """bytes in the body of ``response``
+
+    The body is read, unless the response is streamed; then the
+    ``Content-Length`` header is used.
+    """
+    if not stream:
+        return len(response.content)
+    try:
+        return int(response.headers.get('Content-Length') or 0)
+
+    except ValueError:
+        return 0
+
+
+def backoff(attempt, base=BACKOFF):
+    """jittered exponential backoff before retry ``attempt`` (from 0)"""
+    delay = min(MAX_BACKOFF, base * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class SchedulingAdapter(HTTPAdapter):
+    """Transport adapter that paces requests and retries failed ones
+
+    :param bucket: :class:`TokenBucket` of the server
+    :param retries: maximum number of retries of a request
+    :param kwargs: passed to ``HTTPAdapter``, e.g. ``pool_maxsize``
+    """
+
+    def __init__(self, bucket=None, retries=MAX_RETRIES, **kwargs):
+        self.bucket = bucket or TokenBucket()
+        self.retries = retries
+        super(SchedulingAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            count(request.url)
+            tracer = tracing.current()
+            start = time.time()
+            try:
+                response = super(SchedulingAdapter, self).send(request, **kwargs)
+
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as err:
+                if tracer is not None:
+                    tracer.record(request.method, request.url, None,
+                                  time.time() - start, 0, attempt)
+                if request.method not in IDEMPOTENT or attempt >= self.retries:
+                    raise
+                delay = backoff(attempt)
+                log.warning("%s %s: %s, retry in %.1fs" %
+                            (request.method, request.url, err, delay))
+
+            else:
+                if tracer is not None:
+                    # reading the body first, so the latency includes it
+                    size = body_size(response, kwargs.get('stream'))
+                    tracer.record(request.method, request.url, response.status_code,
+                                  time.time() - start, size, attempt)
+                self.bucket.update(response.headers)
+                if response.status_code == 429:
+                    delay = retry_after(response.headers)
+                    if delay is None:
+                        delay = backoff(attempt)
+                    self.bucket.pause(delay)
+
+                elif response.status_code in RETRY_STATUS and \
+                        request.method in IDEMPOTENT:
+                    delay = backoff(attempt)
+
+                else:
+                    return response
+
+                if attempt >= self.retries:
+                    return response
+
+                log.warning("%s %s: %d, retry in %.1fs" %
+                            (request.method, request.url,
+                             response.status_code, delay))
+                response.close()
+
+            attempt += 1
+            time.sleep(delay)
+
+
+class GitLab(gitlab.Gitlab):
+    """``gitlab.Gitlab`` that leaves retrying to the :class:`SchedulingAdapter`
+
+    python-gitlab retries a 429 itself (``obey_rate_limit``, up to
+    ``max_retries`` times) and, when configured, server errors
+    (``retry_transient_errors``). Each of those retries passes the adapter,
+    which retries on its own, so a single throttled call could be sent some
+    60 times. Both options are off unless a caller passes them; a response
+    the adapter gave up on is then raised as ``GitlabHttpError`` right
+    away. python-gitlab 1.x also sends the options as query parameters,
+    which GitLab ignores.
+    """
+
+    def http_request(self, verb, path, *args, **kwargs):
+        kwargs.setdefault('obey_rate_limit', False)
+        kwargs.setdefault('retry_transient_errors', False)
+        return super(GitLab, self).http_request(verb, path, *args, **kwargs)
+
+
+def count(url):
+    """count a request sent to the server of ``url``"""
+    server = urlparse(url).netloc
+    with _requestlock:
+        _requests[server] = _requests.get(server, 0) + 1
+
+
+def requests_sent():
+    """return the number of requests sent per server, retries included
+
+    :rtype: dict
+    """
+    with _requestlock:
+        return dict(_requests)
+
+
+def bucket(url, rate=None):
+    """return the token bucket of the server of ``url``
+
+    :param url: url of the server
+    :param rate: requests per second, the lowest configured rate wins
+    :rtype: TokenBucket
+    """
+    server = urlparse(url).netloc
+    if server not in _buckets:
+        _buckets[server] = TokenBucket(rate)
+
+    elif rate and (_buckets[server].limit is None or rate < _buckets[server].limit):
+        _buckets[server].limit = rate
+        _buckets[server].rate = rate
+    return _buckets[server]
+
+
+def adapter(poolsize=POOL_SIZE, tokenbucket=None):
+    """return the transport adapter mounted on the sessions
+
+    :param poolsize: number of connections kept open per host
+    :param tokenbucket: :class:`TokenBucket` of the server
+    :rtype: SchedulingAdapter
+    """
+    return SchedulingAdapter(bucket=tokenbucket, pool_connections=poolsize,
+                             pool_maxsize=poolsize)
+
+
+def ratelimit(section):
+    """requests per second configured for ``section`` in ``~/.gltools.cfg``"""
+    # imported here, gltools.config depends on this module
+    from gltools.config import GitLabToolsConfig
+    return GitLabToolsConfig(servername=section).ratelimit
+
+
+def connection(section):
+    """return the connection for a python-gitlab configuration section
+
+    :param section: section in the python-gitlab configuration file
+    :type section: str
+    :rtype: gitlab.Gitlab
+    """
+    with _lock:
+        if section not in _connections:
+            log.debug("connect to %s" % section)
+            gl = GitLab.from_config(section)
+            transport = adapter(tokenbucket=bucket(gl.url, ratelimit(section)))
+            gl.session.mount('http://', transport)
+            gl.session.mount('https://', transport)
+            _connections[section] = gl
+        return _connections[section]
+
+
+def close():
+    """close the sessions of all connections and empty the registry"""
+    with _lock:
+        for gl in _connections.values():
+            gl.session.close()
+        _connections.clear()
@@ -30,3 +30,20 @@ class GLToolsConfigException(Exception):
 
     def __str__(self):
         return "GLTools Config Error %s" % self.message
+
+class GLToolsStepException(GLToolsException):
+    """A step of a workflow failed
+
+    :param step: name of the step
+    :param reason: short, stable reason code, e.g. ``fetch`` or ``rsync``
+    :param message: the error message
+    :returns: Formatted exception message
+    """
+    def __init__(self, step, reason, message):
+        self.step = step
+        self.reason = reason
+        GLToolsException.__init__(self, message)
+
+    def __str__(self):
+        return "GLTools Error %s failed (%s): %s" % (self.step, self.reason,
+                                                     self.message)
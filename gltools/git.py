@@ -1,18 +1,30 @@
 import re
 import os
-import subprocess
 import logging
 
+from .runner import run
 from .exceptions import GLToolsException
 
 log = logging.getLogger('gltools.git')
 
+# the refs kept in a mirror, merge request and other server side refs are
+# left out on purpose
+MIRROR_REFSPECS = ('+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*')
+
 class Git(object):
+    """wrapper around the ``git`` command
+
+    :param logger: logger the output of the commands is sent to
+    :param timeout: seconds after which a git command is killed, None or 0
+                    means no limit
+    """
 
     def __init__(self, **kwargs):
         self._topdir = None
         self._path = None
         self._remote_origin_url = None
+        self.logger = kwargs.get('logger', log)
+        self.timeout = kwargs.get('timeout')
 
     @property
     def topdir(self):
@@ -25,7 +37,7 @@ class Git(object):
         if self._topdir:
             return self._topdir
 
-        topleveldata = self.git("rev-parse", "--show-toplevel")
+        topleveldata = self.git("rev-parse", "--show-toplevel", capture=True)
         self._topdir = topleveldata[0]
         return self._topdir
 
@@ -40,7 +52,8 @@ class Git(object):
         if self._remote_origin_url:
             return self._remote_origin_url
 
-        topleveldata = self.git("config", "--get", "remote.origin.url")
+        topleveldata = self.git("config", "--get", "remote.origin.url",
+                                capture=True)
         self._remote_origin_url = topleveldata[0]
         return self._remote_origin_url
 
@@ -92,35 +105,177 @@ class Git(object):
     def git(self, *args, **kwargs):
         """wrapper for the ``git`` command
 
+        The output is streamed to the logger while the command runs, see
+        :func:`gltools.runner.run`.
+
         :param args: arguments for the command
-        :param kwargs: extra options
+        :param kwargs: extra options: ``cwd``, ``env``, ``timeout`` (defaults
+                       to the one of the instance), ``callback`` and
+                       ``capture``
         :type args: list of strings
         :type kwargs: dict
-        :returns: stdout lines as a list if sucessful
+        :returns: stdout lines as a list if ``capture`` is set
         :rtype: list
         :raise: GLToolsException on fail
         """
-        retv = list()
         command = list()
         command.append(self.which('git'))
         # pylint: disable=W0106
         [command.append(x) for x in args]
         # pylint: enable=W0106
 
-        cmd_args = {'stderr': subprocess.STDOUT, 'stdout': subprocess.PIPE}
-        for kname, kvalue in kwargs.items():
-            cmd_args[kname] = kvalue
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('logger', self.logger)
+        return run(command, **kwargs)
+
+    def mirror(self, url, path):
+        """create or update a bare mirror of the branches and tags of a
+        repository
+
+        The first call clones ``url`` into ``path``, later calls only fetch
+        what changed and prune refs that were removed upstream.
+
+        :param url: url of the repository
+        :param path: location of the bare mirror
+        :type url: str
+        :type path: str
+        :returns: path of the mirror
+        :rtype: str
+        :raise: GLToolsException on fail
+        """
+        if os.path.exists(os.path.join(path, 'HEAD')):
+            log.debug("update mirror %s" % path)
+            self.git("fetch", "--prune", url, *MIRROR_REFSPECS, cwd=path)
+            return path
+
+        log.debug("create mirror %s" % path)
+        try:
+            os.makedirs(os.path.dirname(path))
+
+        except OSError:
+            if not os.path.isdir(os.path.dirname(path)):
+                raise
+
+        self.git("clone", "--bare", url, path)
+        return path
+
+    @staticmethod
+    def parse_refs(lines):
+        """turn ``<sha> <refname>`` lines into a dictionary, skipping peeled
+        tags
+
+        :rtype: dict
+        """
+        retv = dict()
+        for line in lines:
+            if not line.strip():
+                continue
+            sha, refname = line.split(None, 1)
+            if refname.endswith('^{}'):
+                continue
+            retv[refname] = sha
+        return retv
+
+    def refs(self, path):
+        """return the branches and tags of a local repository
+
+        :param path: location of the repository
+        :returns: refname to sha mapping
+        :rtype: dict
+        """
+        return self.parse_refs(self.git("for-each-ref",
+                                        "--format=%(objectname) %(refname)",
+                                        "refs/heads", "refs/tags", cwd=path,
+                                        capture=True))
+
+    def rev_parse(self, path, ref):
+        """return the sha of the commit ``ref`` points to
+
+        :param path: location of the repository
+        :param ref: branch, tag or sha
+        :rtype: str
+        :raise: GLToolsException if ``ref`` is not a commit
+        """
+        return self.git("rev-parse", "--verify", "%s^{commit}" % ref,
+                        cwd=path, capture=True)[0].strip()
+
+    def is_ancestor(self, path, ancestor, ref):
+        """check whether commit ``ancestor`` is part of the history of ``ref``
+
+        :param path: location of the repository
+        :param ancestor: sha of the commit
+        :param ref: branch, tag or sha
+        :returns: False as well when ``ancestor`` is not in the repository
+        :rtype: bool
+        """
+        try:
+            self.git("merge-base", "--is-ancestor", ancestor, ref, cwd=path)
+
+        except GLToolsException:
+            return False
+        return True
+
+    def size(self, path):
+        """return the bytes used by the objects of a local repository
+
+        :param path: location of the repository
+        :returns: size of the loose and packed objects, 0 if there is no
+                  repository
+        :rtype: int
+        """
+        if not os.path.isdir(path):
+            return 0
+
+        values = dict()
+        for line in self.git("count-objects", "-v", cwd=path, capture=True):
+            key, _, value = line.partition(":")
+            values[key.strip()] = value.strip()
+        return (int(values.get('size', 0)) + int(values.get('size-pack', 0))) * 1024
+
+    def ls_remote(self, url):
+        """return the branches and tags of a remote repository
+
+        :param url: url of the repository
+        :returns: refname to sha mapping
+        :rtype: dict
+        """
+        return self.parse_refs(self.git("ls-remote", "--heads", "--tags", url,
+                                        capture=True))
+
+    def push_changed(self, path, url):
+        """push the branches and tags of a local repository that differ
+        from the remote repository in a single push
+
+        The remote follows the local repository, rewritten branches and
+        moved tags included: every ref is pushed with
+        ``--force-with-lease`` against the sha seen by ``ls-remote``, so a
+        ref that is changed on the remote while the push runs is rejected
+        instead of overwritten. New refs must still be missing on the
+        remote. Refs that only exist on the remote are never deleted, they
+        are logged as stale.
+
+        :param path: location of the local repository
+        :param url: url of the remote repository
+        :returns: the refs that were pushed
+        :rtype: list
+        :raise: GLToolsException when the push, or the lease of a ref, fails
+        """
+        local = self.refs(path)
+        remote = self.ls_remote(url)
+        changed = sorted([ref for ref, sha in local.items() if remote.get(ref) != sha])
 
-        process = subprocess.Popen(command, **cmd_args)
-        stdoutdata, stderrdata = process.communicate()
-        if len(stdoutdata.strip()) > 0:
-            for line in stdoutdata.split('\n'):
-                line = line.strip('\n')
-                log.debug(line)
-                retv.append(line)
-        returncode = process.returncode
+        stale = sorted([ref for ref in remote if ref not in local])
+        if stale:
+            log.info("%d refs of %s are not in the source, left alone: %s" %
+                     (len(stale), url, ", ".join(stale)))
 
-        if returncode == 0:
-            return retv
+        if not changed:
+            log.debug("%s is up to date" % url)
+            return changed
 
-        raise GLToolsException("%s\n\n%s" % (stderrdata, stdoutdata))
+        log.debug("push %d refs to %s" % (len(changed), url))
+        leases = ["--force-with-lease=%s:%s" % (ref, remote.get(ref, ''))
+                  for ref in changed]
+        refspecs = ["%s:%s" % (ref, ref) for ref in changed]
+        self.git("push", *(leases + [url] + refspecs), cwd=path)
+        return changed
@@ -8,6 +8,10 @@ import logging
 import pprint
 
 from gltools.exceptions import GLToolsException, GLToolsConfigException
+from gltools.workers import Background, concurrently
+from gltools.records import ProjectRecord
+from gltools.connections import connection
+from gltools.profiling import phase, timed
 
 log = logging.getLogger('gltools.localgitlab')
 
@@ -30,6 +34,152 @@ __version__ = "1.0.1"
 
 CONFIGFILE = os.path.expanduser('~/.python-gitlab.cfg')
 
+# pages of a listing fetched at the same time, and the size of a page
+PAGE_JOBS = 4
+PER_PAGE = 100
+
+
+def listall(manager, jobs=PAGE_JOBS, per_page=PER_PAGE, raw=False, **query):
+    """List all objects of a python-gitlab manager.
+
+    The first page tells how many pages there are, the remaining pages are
+    then fetched ``jobs`` at a time instead of one after another. When the
+    server does not report the number of pages (GitLab leaves it out for
+    very large listings) the pages are followed one by one.
+
+    :param manager: e.g. ``gl.groups`` or ``group.projects``
+    :param jobs: number of pages fetched at the same time
+    :param per_page: number of objects per page
+    :param raw: return the attribute dicts instead of python-gitlab objects
+    :param query: extra query parameters, e.g. ``search``
+    :returns: the objects
+    :rtype: list
+    """
+    def getpage(number):
+        data = dict(query)
+        data.update({'page': number, 'per_page': per_page})
+        return manager.gitlab.http_request('get', manager.path, query_data=data)
+
+    response = getpage(1)
+    pages = [response.json()]
+    total = response.headers.get('X-Total-Pages')
+
+    if total:
+        numbers = range(2, int(total) + 1)
+        log.debug("%s: %s pages" % (manager.path, total))
+        responses = concurrently([lambda number=number: getpage(number)
+                                  for number in numbers], jobs=jobs)
+        pages.extend([x.json() for x in responses])
+
+    else:
+        while response.headers.get('X-Next-Page'):
+            response = getpage(int(response.headers['X-Next-Page']))
+            pages.append(response.json())
+
+    if raw:
+        return [attrs for page in pages for attrs in page]
+
+    # pylint: disable=W0212
+    return [manager._obj_cls(manager, attrs) for page in pages for attrs in page]
+
+
+def iterall(manager, per_page=PER_PAGE, keyset=True, raw=False, **query):
+    """Iterate over all objects of a python-gitlab manager.
+
+    The objects are yielded page by page as they arrive, the next page is
+    requested while the current one is handled. Keyset pagination (ordered
+    by id) is used where the server supports it, which stays fast however
+    deep the listing goes; otherwise it falls back to offset pagination.
+
+    :param manager: e.g. ``group.projects``
+    :param per_page: number of objects per page
+    :param keyset: try keyset pagination first
+    :param raw: yield the attribute dicts instead of python-gitlab objects
+    :param query: extra query parameters
+    :returns: generator of objects
+    """
+    gl = manager.gitlab
+    data = dict(query)
+    data['per_page'] = per_page
+    if keyset:
+        data.update({'pagination': 'keyset', 'order_by': 'id', 'sort': 'asc'})
+
+    try:
+        response = gl.http_request('get', manager.path, query_data=data)
+
+    except gitlab.exceptions.GitlabHttpError as err:
+        if not keyset or err.response_code not in (400, 405):
+            raise
+        log.debug("%s: no keyset pagination, use offset pagination" % manager.path)
+        for obj in iterall(manager, per_page=per_page, keyset=False, raw=raw,
+                           **query):
+            yield obj
+        return
+
+    while response is not None:
+        nextpage = None
+        nexturl = response.links.get('next', {}).get('url')
+        if nexturl:
+            nextpage = Background(lambda url=nexturl: gl.http_request('get', url))
+
+        elif response.headers.get('X-Next-Page'):
+            data['page'] = response.headers['X-Next-Page']
+            nextpage = Background(lambda query=dict(data): gl.http_request(
+                'get', manager.path, query_data=query))
+
+        for attrs in response.json():
+            # pylint: disable=W0212
+            yield attrs if raw else manager._obj_cls(manager, attrs)
+
+        response = nextpage.result() if nextpage is not None else None
+
+
+def walkgroup(group, jobs=PAGE_JOBS, recursive=True):
+    """Yield the projects of a group and, when ``recursive`` is set, the
+    projects of all its subgroups.
+
+    Only the simple representation of the projects is requested, which
+    holds everything gltools uses. The projects are yielded as their pages
+    arrive. The subgroup tree is
+    walked level by level; the subgroups of the next level are listed, all
+    at the same time, while the projects of the current level are handled.
+
+    :param group: group object
+    :param jobs: number of listings fetched at the same time
+    :param recursive: include the projects of the subgroups
+    :returns: generator of the attributes of the projects, in their simple
+              representation
+    """
+    groups = group.manager.gitlab.groups
+
+    def listsubgroups(level):
+        listings = concurrently([lambda obj=obj: listall(obj.subgroups, jobs=jobs)
+                                 for obj in level], jobs=jobs)
+        return [groups.get(x.id, lazy=True) for listing in listings for x in listing]
+
+    level = [group]
+    while level:
+        nextlevel = None
+        if recursive:
+            nextlevel = Background(lambda level=level: listsubgroups(level))
+
+        for obj in level:
+            for attrs in iterall(obj.projects, raw=True, simple='true'):
+                yield attrs
+
+        level = nextlevel.result() if nextlevel is not None else list()
+
+
+def relativepath(full_path, top):
+    """return ``full_path`` relative to the namespace ``top``, e.g.
+    ``roles/web`` for ``ansible/roles/web`` below ``ansible``
+
+    :rtype: str
+    """
+    if full_path and full_path.startswith(top + '/'):
+        return full_path[len(top) + 1:]
+    return ''
+
 class GitLabInitConfig(object):
     """brief explanation
 
@@ -224,6 +374,67 @@ class GitLabConfig(object):
     def has_section(self, section):
         return self.config.has_section(section)
 
+class GroupIndex(object):
+    """Multi-key index of gitlab group objects
+
+    Groups are indexed on their ``id``, ``full_path``, ``full_name``,
+    ``path`` and ``name`` so a group can be found by any of them in
+    constant time. Lookups try the attributes in that order; a value that
+    matches more than one group on the first matching attribute is
+    reported as ambiguous.
+
+    :param groups: initial groups
+    :type groups: list
+
+    Example::
+
+      index = GroupIndex(gl.groups.list(all=True))
+      group = index.lookup('homenet')
+    """
+
+    KEYS = ('id', 'full_path', 'full_name', 'path', 'name')
+
+    def __init__(self, groups=None):
+        self._index = dict()
+        self.update(groups or list())
+
+    def __len__(self):
+        return len(self._index.get('id', {}))
+
+    def update(self, groups):
+        """(re)build the index from ``groups``"""
+        self._index = dict([(key, dict()) for key in self.KEYS])
+        for group in groups:
+            self.add(group)
+
+    def add(self, group):
+        """add a single group to the index"""
+        for key in self.KEYS:
+            value = getattr(group, key, None)
+            if value is None:
+                continue
+            self._index[key].setdefault(str(value), dict())[group.id] = group
+
+    def lookup(self, groupname):
+        """return the group matching ``groupname``
+
+        :param groupname: id, full path, full name, path or name of the group
+        :returns: relevant group or None
+        :raises: GLToolsException if ``groupname`` matches multiple groups
+        """
+        for key in self.KEYS:
+            matches = self._index[key].get(str(groupname))
+            if not matches:
+                continue
+
+            if len(matches) > 1:
+                paths = sorted([group.full_path for group in matches.values()])
+                raise GLToolsException("group %s is ambiguous, it is the %s of %s" %
+                                       (groupname, key, ", ".join(paths)))
+
+            return list(matches.values())[0]
+
+
 class QueryGitLab(object):
     """Wrapper for the ``gitlab`` library
 
@@ -246,8 +457,11 @@ class QueryGitLab(object):
         self._groupname = None
         self._groupid = None
         self._groups = list()
+        self._index = GroupIndex()
         self._gitlab = None
         self.config = GitLabConfig()
+        self.store = kwargs.get('store')
+        self.pagejobs = kwargs.get('pagejobs', PAGE_JOBS)
 
         props = ('configname', 'groupname')
         for prop in props:
@@ -257,10 +471,15 @@ class QueryGitLab(object):
 
 
     def connect(self, configname):
-        """(re)connect to server and refresh the groups list"""
+        """(re)connect to server, the groups list is loaded on first use
+
+        The connection comes from the process wide registry in
+        :mod:`gltools.connections`.
+        """
         log.debug('connect to %s, start' % configname)
-        self._gitlab = gitlab.Gitlab.from_config(self.configname)
-        self._groups = [grp for grp in self.gitlab.groups.list(all=True)]
+        self._gitlab = connection(self.configname)
+        self._groups = list()
+        self._index.update(self._groups)
         log.debug('connect to %s, end' % configname)
 
     # used
@@ -290,7 +509,7 @@ class QueryGitLab(object):
         :returns: True if groupname is available in the server, False if not
         :rtype: bool
         """
-        groups = self.gitlab.getgroup(groupname)
+        groups = self.getgroup(groupname)
         if not groups:
             return False
         else:
@@ -322,20 +541,36 @@ class QueryGitLab(object):
         self._configname = varval
 
         # reset the connection if the variable changes
-        self._gitlab = gitlab.Gitlab.from_config(self._configname)
+        self.connect(self._configname)
 
     @property
     def groups(self):
         """return the gitlab group objects visible to the user"""
 
-        # this should already have been loaded by connect
         if self._groups:
             return self._groups
 
-        self._groups = self.gitlab.groups.list(all=True)
+        with phase('list groups'):
+            if self.store is None:
+                self._groups = listall(self.gitlab.groups, jobs=self.pagejobs)
+            else:
+                groupattrs = self.store.fetch('groups', '', self._listgroupattrs)
+                self._groups = [self._groupobject(attrs) for attrs in groupattrs]
+
+        self._index.update(self._groups)
 
         return self._groups
 
+    def _listgroupattrs(self):
+        return [group.attributes
+                for group in listall(self.gitlab.groups, jobs=self.pagejobs)]
+
+    def _groupobject(self, attrs):
+        """turn cached group attributes back into a group object"""
+        manager = self.gitlab.groups
+        # pylint: disable=W0212
+        return manager._obj_cls(manager, attrs)
+
     @property
     def groupnames(self):
         """return the gitlab group names visible to the user"""
@@ -385,58 +620,101 @@ class QueryGitLab(object):
 
         :param project: project object
         :type project:
-        :rtype: dict
+        :rtype: :class:`gltools.records.ProjectRecord`
 
         """
-        retv = dict()
-
-        attributes = project.attributes
-        namespace = attributes.get('namespace')
-
-        retv['group_id'] = namespace.get('id')
-        retv['group_name'] = namespace.get('name')
-        retv['group_path'] = namespace.get('full_path')
-
-        retv['name'] = attributes.get('name')
-        retv['description'] = attributes.get('description')
-        retv['http_url_to_repo'] = attributes.get('http_url_to_repo')
-        retv['id'] = attributes.get('id')
-        retv['path'] = attributes.get('path')
-        retv['path_with_namespace'] = attributes.get('path_with_namespace')
-        retv['ssh_url_to_repo'] = attributes.get('ssh_url_to_repo')
-        return retv
+        return ProjectRecord.from_attrs(project.attributes)
 
     def getgroup(self, groupname):
-        """Get a single group object from a list of object based on match
-        parameters provided.
+        """Get a single group object based on the name provided.
+
+        Groups seen before are found in the group index. Others are
+        resolved directly through the API by full path or id, falling back
+        to a search when that fails.
 
         if either the ``full_name``, ``name``, ``full_path`` or ``path`` match
         the provide ``groupname`` string the relevant object is returned.
 
         :param groupname: name of the relevant group
         :returns: relevant group
+        :raises: GLToolsException if ``groupname`` matches multiple groups
+        """
+        group = self._index.lookup(groupname)
+        if group is not None or self._groups:
+            return group
+
+        if self.store is not None and self.store.offline and \
+                self.store.get('group', groupname) is None:
+            return self._index.lookup(groupname) if self.groups else None
+
+        with phase('resolve group'):
+            if self.store is None:
+                group = self.resolvegroup(groupname)
+
+            else:
+                attrs = self.store.fetch('group', groupname,
+                                         lambda: self._resolvegroupattrs(groupname))
+                if attrs is not None:
+                    group = self._groupobject(attrs)
+
+        if group is not None:
+            self._index.add(group)
+        return group
+
+    def resolvegroup(self, groupname):
+        """Look up a single group on the server.
+
+        :param groupname: full path, id or name of the group
+        :returns: relevant group or None
+        :raises: GLToolsException if a search yields multiple matches
         """
-        for group in self.groups:
-            matches = [group.full_name, group.name, group.full_path, group.path]
-            for refstr in matches:
-                if groupname == refstr:
-                    return group
+        try:
+            return self.gitlab.groups.get(groupname, with_projects=False)
+
+        except gitlab.exceptions.GitlabGetError:
+            log.debug("%s is not a group path or id, search for it" % groupname)
 
-    def projects(self, groupname):
+        found = GroupIndex(listall(self.gitlab.groups, jobs=self.pagejobs,
+                                   search=groupname))
+        return found.lookup(groupname)
+
+    def _resolvegroupattrs(self, groupname):
+        group = self.resolvegroup(groupname)
+        if group is None:
+            return None
+        return group.attributes
+
+    def projects(self, groupname, recursive=False):
         """List the projects in ``groupname``.
 
+        Every project has a ``relpath``, the path of its namespace relative
+        to ``groupname``. It is empty for the projects of the group itself.
+
         :param groupname: name of the group
+        :param recursive: include the projects of all subgroups
         :type groupname: str
+        :type recursive: bool
+        :returns: generator of project dicts, yielded as they are downloaded
         """
-        retv = list()
+        if self.store is not None:
+            kind = 'allprojects' if recursive else 'projects'
+            rows = self.store.stream(kind, groupname,
+                                     lambda: self._listprojects(groupname, recursive))
+            return (ProjectRecord.from_dict(row) for row in rows)
+
+        return self._listprojects(groupname, recursive)
+
+    def _listprojects(self, groupname, recursive=False):
         log.debug('lookup projects for %s' % groupname)
         obj = self.getgroup(groupname)
         if obj is None:
             raise GLToolsException("Could not find group %s" % groupname)
 
-        for project in obj.projects.list(all=True):
-            retv.append(self.getprojectmeta(project))
-        return retv
+        listing = walkgroup(obj, jobs=self.pagejobs, recursive=recursive)
+        for attrs in timed('api list projects', listing):
+            record = ProjectRecord.from_attrs(attrs)
+            record.relpath = relativepath(record.group_path, obj.full_path)
+            yield record
 
 class MirrorGitLab(object):
     """Wrapper for the ``gitlab`` library
@@ -458,6 +736,8 @@ class MirrorGitLab(object):
         self.gitlab = dict()
         self._source = self.defaultserver
         self._destination = self.defaultserver
+        self.pagejobs = kwargs.get('pagejobs', PAGE_JOBS)
+        self.createjobs = kwargs.get('createjobs', PAGE_JOBS)
 
     @property
     def source(self):
@@ -488,14 +768,19 @@ class MirrorGitLab(object):
         if servername not in self.config.configs:
             raise GLToolsConfigException("config %s not found" % servername)
 
-        log.debug("connect to %s" % servername)
-
-        self.gitlab[servername] = gitlab.Gitlab.from_config(servername)
+        self.gitlab[servername] = connection(servername)
         return self.gitlab[servername]
 
     def get_group_obj(self, servername, groupname):
-        connection = self.connect(servername)
-        objects = connection.groups.list(search=groupname)
+        gl = self.connect(servername)
+        try:
+            return gl.groups.get(groupname, with_projects=False)
+
+        except gitlab.exceptions.GitlabGetError:
+            log.debug("%s is not a group path or id in %s, search for it" %
+                      (groupname, servername))
+
+        objects = gl.groups.list(search=groupname)
 
         if len(objects) == 0:
             return None
@@ -506,79 +791,90 @@ class MirrorGitLab(object):
         raise GLToolsException("search for %s in %s yields multiple results" %
                                (groupname, servername))
 
-    def mirror_to_local(self, src_group, basedir):
+    def mirror_to_local(self, src_group, basedir, recursive=False):
+        """yield a row for every project in ``src_group`` as the listing
+        arrives"""
         srcgrpobj = self.get_group_obj(self.source, src_group)
-        retv = list()
-
-        for srcproj in srcgrpobj.projects.list(all=True):
-            tmpproj = {'namespace_id': srcgrpobj.id, 'basedir': basedir}
-
-            for keyn in ['description', 'group_id', 'http_url_to_repo', 'id',
-                         'name', 'name_with_namespace', 'path',
-                         'path_with_namespace', 'ssh_url_to_repo']:
-                tmpproj[keyn] = srcproj.attributes.get(keyn)
 
-            retv.append(tmpproj)
+        for attrs in walkgroup(srcgrpobj, jobs=self.pagejobs, recursive=recursive):
+            record = ProjectRecord.from_attrs(attrs)
+            record.relpath = relativepath(record.group_path, srcgrpobj.full_path)
+            record['namespace_id'] = srcgrpobj.id
+            record['basedir'] = basedir
+            yield record
 
-        return retv
 
+    def create_project(self, gl, projectdef):
+        """create a project, a failure is logged and yields None
 
-    def mirror_groups(self, src_group, dst_group):
-        srcgrpobj = self.get_group_obj(self.source, src_group)
-        dstgrpobj = self.get_group_obj(self.destination, dst_group)
-        dstconn = gitlab.Gitlab.from_config(self.destination)
-        srcprojs = srcgrpobj.projects.list(all=True)
-        projects = list()
-        srcurls = dict()
-        retv = list()
+        :param gl: gitlab connection of the destination
+        :param projectdef: name, path, description and namespace_id
+        :returns: attributes of the created project
+        :rtype: dict or None
+        """
+        try:
+            project = gl.projects.create(projectdef)
 
-        for srcproj in srcprojs:
-            project = dict()
-            path = srcproj.attributes.get('path')
-            name = srcproj.attributes.get('name')
-            url = srcproj.attributes.get('ssh_url_to_repo')
-            project['name'] = name
-            project['path'] = path
-            project['description'] = srcproj.attributes.get('description')
-            project['namespace_id'] = dstgrpobj.id
-            projects.append(project)
-            srcurls[path] = url
-
-        log.info("create remote projects, start")
-
-        for projectdef in projects:
+        except gitlab.exceptions.GitlabCreateError as err:
             try:
-                project = dstconn.projects.create(projectdef)
+                message = " ".join(err.error_message['name'])
 
-            except gitlab.exceptions.GitlabCreateError as err:
-                try:
-                    message = " ".join(err.error_message['name'])
+            except (IndexError, KeyError, TypeError):
+                message = err
 
-                except IndexError:
-                    message = err
+            log.warn("failed to create %s: %s" % (projectdef['name'], message))
+            return None
 
-                except KeyError:
-                    message = err
+        return project.attributes
 
-                projectdef['error'] = message
-                log.warn("failed to create %(name)s: %(error)s" % projectdef)
+    def mirror_groups(self, src_group, dst_group):
+        """create the projects of ``src_group`` that are missing in
+        ``dst_group`` and yield a row for every project that exists on
+        both sides
 
+        Both groups are listed once, at the same time. Projects are matched
+        by path; only the missing ones are created, ``createjobs`` at a time.
+        The rows of the projects created here have ``created`` set.
+        """
+        def source():
+            srcgrpobj = self.get_group_obj(self.source, src_group)
+            return listall(srcgrpobj.projects, jobs=self.pagejobs, raw=True,
+                           simple='true')
+
+        def destination():
+            dstgrpobj = self.get_group_obj(self.destination, dst_group)
+            return dstgrpobj, listall(dstgrpobj.projects, jobs=self.pagejobs,
+                                      raw=True, simple='true')
+
+        with phase('list source and destination'):
+            srcprojs, (dstgrpobj, dstprojs) = concurrently([source, destination])
+        dstgl = self.connect(self.destination)
+
+        existing = dict([(attrs.get('path'), attrs) for attrs in dstprojs])
+        missing = [attrs for attrs in srcprojs if attrs.get('path') not in existing]
+
+        projectdefs = [{'name': attrs.get('name'),
+                        'path': attrs.get('path'),
+                        'description': attrs.get('description'),
+                        'namespace_id': dstgrpobj.id} for attrs in missing]
+
+        log.info("create %d remote projects, start" % len(projectdefs))
+        with phase('create projects'):
+            created = concurrently([lambda x=x: self.create_project(dstgl, x)
+                                    for x in projectdefs], jobs=self.createjobs)
+        created = dict([(attrs.get('path'), attrs) for attrs in created
+                        if attrs is not None])
+        existing.update(created)
         log.info("create remote projects, end")
 
-        log.info("reload remote project configuration, start")
-        dstgrpobj = self.get_group_obj(self.destination, dst_group)
-
-        for dstproj in dstgrpobj.projects.list(all=True):
-            tmpdict = dict()
-            for keyn in ['description', 'group_id', 'http_url_to_repo', 'id',
-                         'name', 'name_with_namespace', 'path',
-                         'path_with_namespace', 'ssh_url_to_repo']:
-                tmpdict[keyn] = dstproj.attributes.get(keyn)
-
-            path = tmpdict.get('path')
-            tmpdict['src_ssh_url_to_repo'] = srcurls.get(path)
-
-            retv.append(tmpdict)
-        log.info("reload remote project configuration, end")
-
-        return retv
+        for attrs in srcprojs:
+            dstattrs = existing.get(attrs.get('path'))
+            if dstattrs is None:
+                continue
+
+            record = ProjectRecord.from_attrs(dstattrs)
+            record['src_ssh_url_to_repo'] = attrs.get('ssh_url_to_repo')
+            record['src_last_activity_at'] = attrs.get('last_activity_at')
+            record['src_path_with_namespace'] = attrs.get('path_with_namespace')
+            record['created'] = attrs.get('path') in created
+            yield record
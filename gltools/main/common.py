@@ -29,10 +29,13 @@ import re
 import os
 import tempfile
 import logging
-import subprocess
 from gltools.exceptions import GLToolsException
 from gltools.config import GitLabToolsConfig
 from gltools.localgitlab import QueryGitLab
+from gltools.metastore import MetaStore
+from gltools.metrics import Metrics, FETCHED
+from gltools.profiling import phase, timed
+from gltools.workers import WorkerPool, Pipeline, summarize
 
 log = logging.getLogger('gltools.common')
 
@@ -63,6 +66,9 @@ class Main(object):
 
     """
 
+    # name of the command in metrics
+    command = None
+
     def __init__(self, **kwargs):
 
         # command line options
@@ -82,35 +88,60 @@ class Main(object):
 
         self.workdir = kwargs.get('workdir')
         self.dstgroupname = kwargs.get('dstgroupname')
+        self.refresh = kwargs.get('refresh', False)
+        self.offline = kwargs.get('offline', False)
+        self.recursive = kwargs.get('recursive', False)
+
+        self.jobs = kwargs.get('jobs') or 1
+        self.push_jobs = kwargs.get('push_jobs') or self.jobs
 
         self.tempdir = None
         # container variables
         self._gitlab = None
         self._gltcfg = None
-        self._scripttemplate = None
 
         self._maskpatterns = list()
 
         if self.gitlab_config_section is None:
             raise GLToolsException("gitlab config section not defined")
+
+        if self.refresh and self.offline:
+            raise GLToolsException("--refresh and --offline are mutually exclusive")
+
+        self.metrics = None
+        if kwargs.get('metrics'):
+            self.metrics = Metrics(kwargs['metrics'], self.command,
+                                   self.gitlab_config_section, self.srcgroupname)
         log.debug('gitlab_config_section %s' % self.gitlab_config_section)
 
     @property
     def gltcfg(self):
         if not self._gltcfg or self._gltcfg is None:
             log.debug("start")
-            self._gltcfg = GitLabToolsConfig(servername=self.gitlab_config_section,
-                                             groupname=self.srcgroupname)
+            with phase('config'):
+                self._gltcfg = GitLabToolsConfig(servername=self.gitlab_config_section,
+                                                 groupname=self.srcgroupname)
         return self._gltcfg
 
     @property
     def gitlab(self):
         if self._gitlab is None:
             log.debug('connect to %s' % self.gitlab_config_section)
-            self._gitlab = QueryGitLab(configname=self.gitlab_config_section)
+            with phase('connect'):
+                self._gitlab = QueryGitLab(configname=self.gitlab_config_section,
+                                           store=self.metastore)
             log.debug('connect to %s, done' % self.gitlab_config_section)
         return self._gitlab
 
+    @property
+    def metastore(self):
+        """the local metadata store for the configured gitlab section"""
+        return MetaStore(self.gitlab_config_section,
+                         cachedir=self.gltcfg.cachedir,
+                         ttl=self.gltcfg.cachettl,
+                         refresh=self.refresh,
+                         offline=self.offline)
+
     @property
     def maskpatterns(self):
         if self._maskpatterns:
@@ -158,17 +189,16 @@ class Main(object):
         return False
 
     def getprojects(self):
-        """get a list of projects
+        """get the projects, as they are downloaded
 
-        :returns: list of dicts
-        :rtype: list
+        :returns: generator of dicts
 
         """
 
-        retv = list()
         log.debug('start')
 
-        for row in self.gitlab.projects(self.srcgroupname):
+        rows = self.gitlab.projects(self.srcgroupname, recursive=self.recursive)
+        for row in timed('list projects', rows):
             log.debug('project: %(name)s' % row)
             if self.ignore_extended(row):
                 continue
@@ -181,10 +211,55 @@ class Main(object):
             if self.http:
                 row['url'] = row.get('http_url_to_repo')
 
-            retv.append(row)
+            yield row
 
         log.debug('end')
-        return retv
+
+    @staticmethod
+    def label(row):
+        """label of a project in the log, the path relative to the group for
+        projects in subgroups
+
+        :rtype: str
+        """
+        return "/".join([x for x in (row.get('relpath'), row.get('name')) if x])
+
+    @property
+    def sizekey(self):
+        """row key the bytes fetched for a project are stored in, None when
+        no metrics are written"""
+        if self.metrics is None:
+            return None
+        return FETCHED
+
+    def observed(self, func):
+        """wrap the job ``func`` so what it did for a row ends up in the
+        metrics"""
+        if self.metrics is None:
+            return func
+
+        def job(row):
+            try:
+                return func(row)
+            finally:
+                self.metrics.observe(self.label(row), row)
+        return job
+
+    def write_metrics(self, results):
+        """write the metrics of the projects handled so far, also when the
+        run is aborted; a failure to write them is logged, so it does not
+        hide the error that ended the run
+
+        :param results: the job results of the run
+        """
+        if self.metrics is None:
+            return
+
+        try:
+            self.metrics.write(results)
+
+        except (IOError, OSError) as err:
+            log.error("failed to write metrics to %s: %s" % (self.metrics.path, err))
 
     def mktemp(self, suffix='_gltools'):
 
@@ -204,46 +279,47 @@ class Main(object):
                                 prefix=self.srcgroupname + "_",
                                 dir=self.tempdir)
 
-    def exec_script(self, scriptfile):
-        """Execute a scriptfile
-
-        :returns: arg1/arg2 +arg3
-        :rtype: int, float
-
-        Example::
-
-          obj.exec_script("somefile.sh")
+    def run_jobs(self, func, rows, action="processed"):
+        """Run ``func`` for every row using up to ``self.jobs`` workers and
+        report the aggregated result.
 
+        :param func: callable taking a single project row
+        :param rows: iterable of project rows
+        :param action: verb used in the summary
+        :returns: the job results
+        :rtype: list of :class:`gltools.workers.JobResult`
+        :raises: GLToolsException if one or more projects failed
         """
-        retv = list()
-        command = list()
-
-        command.append(scriptfile)
-
-        log.debug("  execute %s" % scriptfile)
-
-        process = subprocess.Popen(command,
-                                   stderr=subprocess.PIPE,
-                                   stdout=subprocess.PIPE)
-
-        stdoutdata, stderrdata = process.communicate()
-
-        if stdoutdata is not None and len(stdoutdata.strip()) > 0:
-            for line in stdoutdata.split('\n'):
-                line = line.strip('\n')
-                log.debug(">>  %s" % line)
-                retv.append(line)
-
-        if stderrdata is not None and len(stderrdata.strip()) > 0:
-            for line in stderrdata.split('\n'):
-                line = line.strip('\n')
-                log.error("!!  %s" % line)
-
-        returncode = process.returncode
-
-        if returncode != 0:
-            log.error("  execute %s, failed" % scriptfile)
-            raise GLToolsException(retv[0])
-
-        log.debug("  execute %s, success" % scriptfile)
-        return retv
+        pool = WorkerPool(jobs=self.jobs)
+        try:
+            results = pool.map(self.observed(func), rows, label=self.label)
+        finally:
+            self.write_metrics(pool.results())
+        return self.check_results(results, action)
+
+    def run_pipeline(self, stages, rows, action="processed"):
+        """Run every row through ``stages`` and report the aggregated
+        result including per project timing.
+
+        :param stages: ``(name, func, jobs)`` tuples in execution order
+        :param rows: iterable of project rows
+        :param action: verb used in the summary
+        :returns: the job results
+        :rtype: list of :class:`gltools.workers.JobResult`
+        :raises: GLToolsException if one or more projects failed
+        """
+        pipeline = Pipeline([(name, self.observed(func), jobs)
+                             for name, func, jobs in stages])
+        try:
+            results = pipeline.run(rows, label=self.label)
+        finally:
+            self.write_metrics(pipeline.results())
+        return self.check_results(results, action)
+
+    @staticmethod
+    def check_results(results, action):
+        failed = summarize(results, action)
+        if failed:
+            raise GLToolsException("%d of %d projects failed" %
+                                   (len(failed), len(results)))
+        return results
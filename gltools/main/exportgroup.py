@@ -5,60 +5,106 @@
 import os
 import tempfile
 import logging
-import pkgutil
 from gltools.main.common import Main
+from gltools.git import Git
+from gltools.mirrorcache import MirrorCache
+from gltools.profiling import phase
+from gltools.steps import Workflow, Mirror, MakeDirs, Bundle, IncrementalBundle, Archive, \
+    Command, Remove
 
 log = logging.getLogger('gltools.main.exportgroup')
 
 class ExportGroup(Main):
 
+    command = 'export'
+
     def __init__(self, **kwargs):
         self.tempdir = None
 
         super(ExportGroup, self).__init__(**kwargs)
 
+        self.incremental = kwargs.get('incremental', False)
+
         if self.outputdir is None:
             self.outputdir = self.gltcfg.exportdir
 
         if self.tempdir is None:
             self.tempdir = self.gltcfg.tempdir
 
-        self._scripttemplate = pkgutil.get_data(__package__, 'export.sh')
-
+        self.mirrorcache = MirrorCache(self.gltcfg.mirrordir,
+                                       self.gitlab_config_section)
+
+        self.workflow = Workflow('export', self.steps(),
+                                 git=Git(logger=log, timeout=self.gltcfg.timeout))
+
+    @staticmethod
+    def is_bundle(row):
+        return row['type'] == 'bundle'
+
+    @staticmethod
+    def is_incremental(row):
+        return row['type'] == 'incremental'
+
+    @staticmethod
+    def is_portable(row):
+        return row['type'] == 'portable'
+
+    def has_roles(self, row):
+        requirements = "%(tempdir)s/archive/%(path)s/roles/requirements.yml" % row
+        return self.is_portable(row) and os.path.exists(requirements)
+
+    def steps(self):
+        """the steps of the export of a single project"""
+        outputfile = '%(outputdir)s/%(group_path)s/%(path)s'
+        archivedir = '%(tempdir)s/archive/%(path)s'
+        return [
+            Mirror('%(url)s', self.mirrorcache.path, sizekey=self.sizekey),
+            MakeDirs('%(outputdir)s/%(group_path)s'),
+            Bundle('%(mirror)s', outputfile + '.bundle', when=self.is_bundle),
+            IncrementalBundle('%(mirror)s', outputfile + '.bundles', '%(path)s',
+                              project='%(path_with_namespace)s',
+                              chain=self.gltcfg.bundlechain, when=self.is_incremental),
+            Archive('%(mirror)s', '%(tempdir)s/archive', '%(path)s',
+                    when=self.is_portable),
+            Command(['ansible-galaxy', 'install',
+                     '-r', archivedir + '/roles/requirements.yml',
+                     '-p', archivedir + '/roles'],
+                    name='roles', reason='roles', when=self.has_roles),
+            Command(['rsync', '-a', '--delete', archivedir + '/', outputfile + '/'],
+                    name='rsync', reason='rsync', when=self.is_portable),
+            Remove('%(tempdir)s'),
+        ]
 
     def export_project(self, row, outputdir, tempdir):
+        """Export a single project.
+
+        Every project is staged in its own directory below ``tempdir`` so
+        several exports can run side by side. The export is made from the
+        project's mirror in the mirror cache, which is updated first.
+        """
         row['outputdir'] = outputdir
-        row['tempdir'] = tempdir
+        row['tempdir'] = tempfile.mkdtemp(prefix=row['path'] + "_", dir=tempdir)
 
         log.info("%(name)s" % row)
         log.debug("export %(name)s, start" % row)
-        scriptname = "%(group_path)s_%(name)s.sh" % row
-        scriptname = scriptname.lower().replace(' ', '_')
-        outfile = os.path.join(tempdir, scriptname)
-        log.debug("  wrote scriptfile: %s" % outfile)
-        with open(outfile, "w") as ofh:
-            ofh.write(self._scripttemplate % row)
-        os.chmod(outfile, 493)
-        self.exec_script(outfile)
-        os.unlink(outfile)
+        self.workflow.run(row)
         log.debug("export %(name)s, end" % row)
 
     def getprojects(self):
 
-        retv = list()
-
         for row in super(ExportGroup, self).getprojects():
 
             row['type'] = "portable"
-            if self.bundles:
+            if self.incremental:
+                row['type'] = "incremental"
+            elif self.bundles:
                 row['type'] = "bundle"
 
             row['url'] = row.get('ssh_url_to_repo')
             if self.http:
                 row['url'] = row.get('http_url_to_repo')
 
-            retv.append(row)
-        return retv
+            yield row
 
     def main(self):
         log.info("outputdir: %s" % self.outputdir)
@@ -72,5 +118,6 @@ class ExportGroup(Main):
                                    prefix=self.srcgroupname + "_",
                                    dir=self.tempdir)
 
-        for row in self.getprojects():
-            self.export_project(row, self.outputdir, tempdir)
+        with phase('export'):
+            self.run_jobs(lambda row: self.export_project(row, self.outputdir, tempdir),
+                          self.getprojects(), "exported")
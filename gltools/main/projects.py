@@ -53,10 +53,13 @@ class ListProjects(Main):
 
     def main(self):
         legend = ['name']
+        if self.recursive:
+            legend.insert(0, 'relpath')
         if not self.terse:
             legend.append('url')
             legend.append('description')
 
-        rows = super(ListProjects, self).getprojects()
+        # the column widths depend on all rows
+        rows = list(super(ListProjects, self).getprojects())
         self.tabulate(legend, rows)
 
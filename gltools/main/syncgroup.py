@@ -6,11 +6,16 @@ from __future__ import print_function
 
 import os
 import logging
-import pkgutil
-import tempfile
+from abc import abstractmethod, abstractproperty
 
 from gltools.main.common import Main
+from gltools.workers import SKIPPED
+from gltools.git import Git
 from gltools.localgitlab import MirrorGitLab
+from gltools.mirrorcache import MirrorCache
+from gltools.syncstate import SyncState
+from gltools.steps import ABC, Workflow, Mirror, PushChanged
+from gltools.profiling import phase, timed
 from gltools.config import GitLabToolsConfig
 from gltools.exceptions import GLToolsException
 
@@ -23,7 +28,115 @@ __license__ = "proprietary"
 __version__ = "1.0.1"
 
 
-class SyncGroup(Main):
+class SyncBase(Main, ABC):
+    """Shared handling of :class:`SyncGroup` and :class:`SyncGroupLocal`.
+
+    Subclasses provide the stages a project goes through and tell which url and
+    activity stamp of a row describe the source and how to check the
+    destination. Projects whose source did not change since the last
+    successful sync are skipped unless ``full`` is set.
+    """
+
+    def __init__(self, **kwargs):
+        super(SyncBase, self).__init__(**kwargs)
+
+        self.full = kwargs.get('full', False)
+
+        self._git = Git(logger=log, timeout=self.gltcfg.timeout)
+        self._state = None
+
+    @property
+    def state(self):
+        """watermarks of earlier syncs of this source/destination pair"""
+        if self._state is None:
+            self._state = SyncState(self.statesource, self.statedestination,
+                                    os.path.join(self.gltcfg.cachedir, 'syncstate'))
+        return self._state
+
+    @property
+    def statesource(self):
+        return "%s:%s" % (self.gitlab_config_section, self.srcgroupname)
+
+    @abstractproperty
+    def statedestination(self):
+        """description of the destination in the sync state"""
+
+    @abstractmethod
+    def sourceurl(self, row):
+        """url of the source repository of ``row``"""
+
+    @abstractmethod
+    def activity(self, row):
+        """``last_activity_at`` of the source project of ``row``"""
+
+    @abstractmethod
+    def destination_current(self, row, heads):
+        """check whether the destination of ``row`` still has the synced
+        refs ``heads``
+
+        :rtype: bool
+        """
+
+    @staticmethod
+    def statekey(row):
+        """key of a project in the sync state, its path relative to the
+        group"""
+        return "/".join([x for x in (row.get('relpath'), row['path']) if x])
+
+    def syncedrefs(self, refs):
+        """select the refs that are synced from a refname to sha mapping"""
+        return refs
+
+    def is_current(self, row):
+        """Check whether the source of ``row`` is unchanged since the last
+        sync and the destination still has what was synced. Besides the
+        ``last_activity_at`` watermark the recorded refs are compared with
+        the source (GitLab only updates the activity stamp once an hour) and
+        with the destination, which may have been removed, recreated or
+        pushed to since. Projects that were just created are never current.
+
+        :rtype: bool
+        """
+        if self.full or row.get('created'):
+            return False
+
+        if not self.state.unchanged(self.statekey(row), self.activity(row)):
+            return False
+
+        heads = self.state.get(self.statekey(row)).get('heads')
+        if self.syncedrefs(self._git.ls_remote(self.sourceurl(row))) != heads:
+            return False
+
+        return self.destination_current(row, heads)
+
+    def skip_project(self, row):
+        """check whether ``row`` is unchanged since the last sync
+
+        :returns: True if the project can be skipped
+        :rtype: bool
+        """
+        if self.is_current(row):
+            log.info("%(name)s unchanged since the last sync, skipped" % row)
+            return True
+
+        log.info("%(name)s" % row)
+        return False
+
+    def stages(self):
+        """the ``(name, func, jobs)`` stages a project goes through"""
+        return [('fetch', self.fetch_project, self.jobs),
+                ('push', self.push_project, self.push_jobs)]
+
+    def sync_projects(self, rows):
+        """run the stages for all rows and save the watermarks of the
+        projects that were synced"""
+        try:
+            self.run_pipeline(self.stages(), rows, "synced")
+        finally:
+            self.state.save()
+
+
+class SyncGroup(SyncBase):
     """this class syncs data from one group to another.
 
     extended explanation
@@ -33,10 +146,14 @@ class SyncGroup(Main):
     :type arg1: type description
     :type arg1: type description
 
-    .. note:: we only use origin/main and ssh for the moment. Life is hard
-              enough already.
+    All branches and tags are synced through a local mirror of the source
+    project; only refs that differ from the destination are pushed.
+
+    .. note:: we only use ssh for the moment. Life is hard enough already.
     """
 
+    command = 'sync'
+
     def __init__(self, **kwargs):
         super(SyncGroup, self).__init__(**kwargs)
 
@@ -46,31 +163,55 @@ class SyncGroup(Main):
         self.dstconfig = GitLabToolsConfig(servername=self.dst_gitlab_config_section,
                                            groupname=self.dstgroupname)
 
-        self.repository = "source"
-        self.refspec = "master"
-
-        self._scripttemplate = pkgutil.get_data(__package__, 'sync.sh')
-
-    def sync_project(self, row, tempdir):
-        row['tempdir'] = tempdir
-        row['branch'] = self.refspec
-        row['source'] = self.repository
-        log.info("%(name)s" % row)
-        log.debug("sync %(name)s, start" % row)
-        scriptname = "%(path)s.sh" % row
-        outfile = os.path.join(tempdir, scriptname)
-        log.debug("  wrote scriptfile: %s" % outfile)
-        with open(outfile, "w") as ofh:
-            ofh.write(self._scripttemplate % row)
-
-        os.chmod(outfile, 493)
-        self.exec_script(outfile)
-        os.unlink(outfile)
-        log.debug("export %(name)s, end" % row)
+        self.mirrorcache = MirrorCache(self.srcconfig.mirrordir,
+                                       self.gitlab_config_section)
+
+        self.fetchflow = Workflow('fetch', [
+            Mirror(self.sourceurl,
+                   lambda row: self.mirrorcache.path(row, 'src_path_with_namespace'),
+                   sizekey=self.sizekey),
+        ], git=self._git)
+        self.pushflow = Workflow('push', [
+            PushChanged('%(mirror)s', '%(ssh_url_to_repo)s'),
+        ], git=self._git)
+
+    @property
+    def statedestination(self):
+        return "%s:%s" % (self.dst_gitlab_config_section, self.dstgroupname)
+
+    @staticmethod
+    def sourceurl(row):
+        return row.get('src_ssh_url_to_repo')
+
+    @staticmethod
+    def activity(row):
+        return row.get('src_last_activity_at')
+
+    def destination_current(self, row, heads):
+        """check whether the destination project still has the recorded
+        refs, refs added on the destination itself are left alone"""
+        remote = self._git.ls_remote(row['ssh_url_to_repo'])
+        return all([remote.get(ref) == sha for ref, sha in heads.items()])
+
+    def fetch_project(self, row):
+        """update the mirror of the source project"""
+        if self.skip_project(row):
+            return SKIPPED
+
+        log.debug("fetch %(name)s, start" % row)
+        self.fetchflow.run(row)
+        log.debug("fetch %(name)s, end" % row)
+
+    def push_project(self, row):
+        """push the refs of the mirror that differ from the destination"""
+        log.debug("push %(name)s, start" % row)
+        self.pushflow.run(row)
+        log.info("%s: %d refs pushed" % (row['name'], len(row['pushed'])))
+        self.state.record(self.statekey(row), self.activity(row),
+                          self._git.refs(row['mirror']))
+        log.debug("push %(name)s, end" % row)
 
     def main(self):
-        tempdir = self.mktemp('_sync')
-
         if not self.srcconfig.protected:
             log.warn("%s should be protected in gltools config" % self.srcgroupname)
 
@@ -81,10 +222,13 @@ class SyncGroup(Main):
         mirror.source = self.gitlab_config_section
         mirror.destination = self.dst_gitlab_config_section
         mirrordata = mirror.mirror_groups(self.srcgroupname, self.dstgroupname)
-        for row in mirrordata:
-            self.sync_project(row, tempdir)
+        with phase('sync'):
+            self.sync_projects(timed('list projects', mirrordata))
+
 
-class SyncGroupLocal(Main):
+class SyncGroupLocal(SyncBase):
+
+    command = 'synclocal'
 
     def __init__(self, **kwargs):
         super(SyncGroupLocal, self).__init__(**kwargs)
@@ -92,40 +236,57 @@ class SyncGroupLocal(Main):
         self.srcconfig = GitLabToolsConfig(servername=self.gitlab_config_section,
                                            groupname=self.srcgroupname)
 
-        self.repository = "source"
-        self.refspec = "master"
-        # self.dstdirectory 
-
-        self._scripttemplate = pkgutil.get_data(__package__, 'synclocal.sh')
-
-    def sync_project(self, row, tempdir):
-
-        scriptname = "%(path)s.sh" % row
-        outfile = os.path.join(tempdir, scriptname)
-
-        row['tempdir'] = tempdir
-        row['branch'] = self.refspec
-        row['source'] = self.repository
-
-        log.info("%(name)s" % row)
-        log.debug("sync %(name)s, start" % row)
-        log.debug("  wrote scriptfile: %s" % outfile)
-        with open(outfile, "w") as ofh:
-            ofh.write(self._scripttemplate % row)
-
-        os.chmod(outfile, 493)
-        self.exec_script(outfile)
-        os.unlink(outfile)
-        log.debug("export %(name)s, end" % row)
+        self.fetchflow = Workflow('fetch', [
+            Mirror(self.sourceurl, self.destination, key='destination',
+                   sizekey=self.sizekey),
+        ], git=self._git)
+
+    @property
+    def statedestination(self):
+        return os.path.abspath(self.dstdirectory)
+
+    @staticmethod
+    def sourceurl(row):
+        return row.get('ssh_url_to_repo')
+
+    @staticmethod
+    def activity(row):
+        return row.get('last_activity_at')
+
+    @staticmethod
+    def destination(row):
+        return os.path.join(row['basedir'], row['path_with_namespace'] + '.git')
+
+    def destination_current(self, row, heads):
+        """check whether the destination repository still exists with the
+        recorded refs"""
+        path = self.destination(row)
+        if not os.path.exists(os.path.join(path, 'HEAD')):
+            return False
+        return self._git.refs(path) == heads
+
+    def stages(self):
+        return [('fetch', self.fetch_project, self.jobs)]
+
+    def fetch_project(self, row):
+        """fetch the branches and tags of the source straight into the
+        bare destination repository"""
+        if self.skip_project(row):
+            return SKIPPED
+
+        log.debug("fetch %(name)s, start" % row)
+        self.fetchflow.run(row)
+        self.state.record(self.statekey(row), self.activity(row),
+                          self._git.refs(row['destination']))
+        log.debug("fetch %(name)s, end" % row)
 
     def main(self):
-        tempdir = self.mktemp('_synclocal')
-
         if not self.srcconfig.protected:
             log.warn("%s should be protected in gltools config" % self.srcgroupname)
 
         mirror = MirrorGitLab()
         mirror.source = self.gitlab_config_section
-        mirrordata = mirror.mirror_to_local(self.srcgroupname, self.dstdirectory)
-        for row in mirrordata:
-            self.sync_project(row, tempdir)
+        mirrordata = mirror.mirror_to_local(self.srcgroupname, self.dstdirectory,
+                                            recursive=self.recursive)
+        with phase('sync'):
+            self.sync_projects(timed('list projects', mirrordata))
@@ -7,6 +7,7 @@ import logging
 from gltools.git import Git
 from gltools.config import GitLabToolsConfig
 from gltools.main.common import Main
+from gltools.profiling import phase
 
 log = logging.getLogger('gltools.main.workongroup')
 
@@ -22,6 +23,8 @@ class WorkOnGroup(Main):
 
     """
 
+    command = 'setup'
+
     def __init__(self, **kwargs):
         self.tempdir = None
 
@@ -38,7 +41,7 @@ class WorkOnGroup(Main):
         if self.tempdir is None:
             self.tempdir = self.gltcfg.tempdir
 
-        self._git = Git(logger=log)
+        self._git = Git(logger=log, timeout=self.gltcfg.timeout)
 
     @property
     def grouppath(self):
@@ -53,29 +56,40 @@ class WorkOnGroup(Main):
 
     def getprojects(self):
 
-        retv = list()
-
         for row in super(WorkOnGroup, self).getprojects():
             row['url'] = row.get('ssh_url_to_repo')
             if self.http:
                 row['url'] = row.get('http_url_to_repo')
 
-            retv.append(row)
-        return retv
+            yield row
+
+    def parentpath(self, row):
+        """directory the clone of the project is kept in, subgroups of the
+        group become subdirectories"""
+        return os.path.join(self.grouppath, row.get('relpath') or '')
+
+    def projectpath(self, row):
+        return os.path.join(self.parentpath(row), row.get('path'))
 
     def setup_project(self, row):
         self.setup_group()
-        projectpath = os.path.join(self.grouppath, row.get('path'))
+        projectpath = self.projectpath(row)
         gitconfig = os.path.join(projectpath, '.git', 'config')
 
+        if self.sizekey is not None:
+            before = self._git.size(projectpath)
+
         if os.path.exists(gitconfig):
-            return self.update_project(row)
+            self.update_project(row)
 
         else:
-            return self.clone_project(row)
+            self.clone_project(row)
+
+        if self.sizekey is not None:
+            row[self.sizekey] = max(0, self._git.size(projectpath) - before)
 
     def update_project(self, row):
-        projectpath = os.path.join(self.grouppath, row.get('path'))
+        projectpath = self.projectpath(row)
         log.info("update path %s, START" % projectpath)
 
         log.debug("  pull last version, START")
@@ -86,11 +100,18 @@ class WorkOnGroup(Main):
         log.debug("update path %s, END" % projectpath)
 
     def clone_project(self, row):
-        projectpath = os.path.join(self.grouppath, row.get('path'))
+        projectpath = self.projectpath(row)
+        parentpath = self.parentpath(row)
         log.debug("clone path %s" % projectpath)
-        self._git.git("clone", row.get('url'), cwd=self.grouppath)
+        try:
+            os.makedirs(parentpath)
 
-    def main(self):
+        except OSError:
+            if not os.path.isdir(parentpath):
+                raise
 
-        for row in self.getprojects():
-            self.setup_project(row)
+        self._git.git("clone", row.get('url'), cwd=parentpath)
+
+    def main(self):
+        with phase('setup'):
+            self.run_jobs(self.setup_project, self.getprojects(), "set up")
@@ -0,0 +1,266 @@
+"""Persistent local store for GitLab metadata.
+
+Group and project listings are kept in a SQLite database under
+``~/.cache/gltools`` so repeated ``glt`` invocations do not have to download
+them from the server every time. Entries are keyed by the python-gitlab
+configuration section, a kind (e.g. ``groups`` or ``projects``) and a key
+(e.g. the group name) and expire after a configurable time to live.
+
+Example::
+
+  from gltools.metastore import MetaStore
+
+  store = MetaStore('local', ttl=600)
+  projects = store.fetch('projects', 'homenet', lambda: download('homenet'))
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+
+from gltools.exceptions import GLToolsException
+
+log = logging.getLogger('gltools.metastore')
+
+CACHEDIR = os.path.expanduser('~/.cache/gltools')
+DEFAULT_TTL = 3600
+DBNAME = 'metadata.sqlite'
+
+# rows of a streamed listing written or read per transaction
+PAGE = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+  section TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  key TEXT NOT NULL,
+  stamp REAL NOT NULL,
+  data TEXT NOT NULL,
+  PRIMARY KEY (section, kind, key)
+);
+CREATE TABLE IF NOT EXISTS listrows (
+  section TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  key TEXT NOT NULL,
+  generation TEXT NOT NULL,
+  position INTEGER NOT NULL,
+  data TEXT NOT NULL,
+  PRIMARY KEY (section, kind, key, generation, position)
+);
+"""
+
+
+class MetaStore(object):
+    """Cache of GitLab metadata for a single configuration section.
+
+    :param section: section in the python-gitlab configuration file
+    :param cachedir: directory holding the database
+    :param ttl: time to live of the entries in seconds
+    :param refresh: ignore cached entries and download everything again
+    :param offline: only use cached entries, regardless of their age
+    :type section: str
+    :type cachedir: str
+    :type ttl: int
+    :type refresh: bool
+    :type offline: bool
+    """
+
+    def __init__(self, section, cachedir=None, ttl=DEFAULT_TTL, refresh=False,
+                 offline=False):
+        self.section = section
+        self.cachedir = os.path.expanduser(cachedir or CACHEDIR)
+        self.ttl = int(ttl)
+        self.refresh = refresh
+        self.offline = offline
+
+        if refresh and offline:
+            raise GLToolsException("refresh and offline are mutually exclusive")
+
+    @property
+    def dbfile(self):
+        """full path of the database"""
+        return os.path.join(self.cachedir, DBNAME)
+
+    def connect(self):
+        """open the database, creating it if needed
+
+        :rtype: sqlite3.Connection
+        """
+        try:
+            os.makedirs(self.cachedir)
+
+        except OSError:
+            if not os.path.isdir(self.cachedir):
+                raise
+
+        connection = sqlite3.connect(self.dbfile, timeout=30)
+        connection.executescript(SCHEMA)
+        return connection
+
+    def get(self, kind, key=''):
+        """return the cached data or None if it is absent or expired
+
+        :param kind: kind of data, e.g. ``groups``
+        :param key: key within the kind, e.g. a group name
+        """
+        if self.refresh:
+            return None
+
+        connection = self.connect()
+        try:
+            row = connection.execute(
+                "SELECT stamp, data FROM entries"
+                " WHERE section = ? AND kind = ? AND key = ?",
+                (self.section, kind, key)).fetchone()
+        finally:
+            connection.close()
+
+        if row is None:
+            log.debug("%s/%s/%s not cached" % (self.section, kind, key))
+            return None
+
+        stamp, data = row
+        age = time.time() - stamp
+        if not self.offline and age > self.ttl:
+            log.debug("%s/%s/%s expired (%ds old)" % (self.section, kind, key, age))
+            return None
+
+        log.debug("%s/%s/%s from cache (%ds old)" % (self.section, kind, key, age))
+        return json.loads(data)
+
+    def put(self, kind, key, data):
+        """store ``data``, which must be serializable to json
+
+        :param kind: kind of data, e.g. ``groups``
+        :param key: key within the kind, e.g. a group name
+        :param data: the data to store
+        """
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries (section, kind, key, stamp, data)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (self.section, kind, key, time.time(), json.dumps(data)))
+        finally:
+            connection.close()
+
+    def fetch(self, kind, key, loader):
+        """return cached data, calling ``loader`` to get (and store) fresh
+        data when needed
+
+        :param kind: kind of data, e.g. ``groups``
+        :param key: key within the kind, e.g. a group name
+        :param loader: callable returning the data from the server
+        :raises: GLToolsException when offline and nothing is cached
+        """
+        data = self.get(kind, key)
+        if data is not None:
+            return data
+
+        if self.offline:
+            raise GLToolsException("no cached %s %s available for %s in offline mode" %
+                                   (kind, key, self.section))
+
+        data = loader()
+        if data is not None:
+            self.put(kind, key, data)
+        return data
+
+    def stream(self, kind, key, loader):
+        """like :meth:`fetch`, but for listings that are handled while they
+        are downloaded
+
+        Cached rows are read from the store a page at a time. Otherwise the
+        rows of ``loader`` are yielded as they arrive and written a page at
+        a time under a new generation, so the listing is never held in
+        memory. The entry of the listing only points to the new generation
+        once the listing is complete; an interrupted listing is not cached
+        and its rows are removed by the next complete one.
+
+        :param kind: kind of data, e.g. ``projects``
+        :param key: key within the kind, e.g. a group name
+        :param loader: callable returning an iterable of dicts
+        :raises: GLToolsException when offline and nothing is cached
+        """
+        data = self.get(kind, key)
+        if data is None and self.offline:
+            raise GLToolsException("no cached %s %s available for %s in offline mode" %
+                                   (kind, key, self.section))
+
+        if data is not None:
+            for row in self._readrows(kind, key, data['generation']):
+                yield row
+            return
+
+        generation = uuid.uuid4().hex
+        count = 0
+        page = list()
+        for row in loader():
+            # callers add their own keys to the rows, store a clean copy
+            page.append(json.dumps(dict(row)))
+            if len(page) == PAGE:
+                self._writerows(kind, key, generation, count, page)
+                count += len(page)
+                page = list()
+            yield row
+
+        self._writerows(kind, key, generation, count, page)
+        count += len(page)
+        self._complete(kind, key, generation, count)
+
+    def _readrows(self, kind, key, generation):
+        position = 0
+        while True:
+            connection = self.connect()
+            try:
+                page = connection.execute(
+                    "SELECT data FROM listrows"
+                    " WHERE section = ? AND kind = ? AND key = ? AND generation = ?"
+                    " AND position >= ? ORDER BY position LIMIT ?",
+                    (self.section, kind, key, generation, position, PAGE)).fetchall()
+            finally:
+                connection.close()
+
+            for (data,) in page:
+                yield json.loads(data)
+
+            if len(page) < PAGE:
+                return
+            position += PAGE
+
+    def _writerows(self, kind, key, generation, position, page):
+        if not page:
+            return
+
+        connection = self.connect()
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO listrows (section, kind, key, generation, position, data)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [(self.section, kind, key, generation, position + index, data)
+                     for index, data in enumerate(page)])
+        finally:
+            connection.close()
+
+    def _complete(self, kind, key, generation, count):
+        """point the entry of a listing to ``generation`` and remove the
+        rows of all other generations"""
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries (section, kind, key, stamp, data)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (self.section, kind, key, time.time(),
+                     json.dumps({'generation': generation, 'rows': count})))
+                connection.execute(
+                    "DELETE FROM listrows"
+                    " WHERE section = ? AND kind = ? AND key = ? AND generation != ?",
+                    (self.section, kind, key, generation))
+        finally:
+            connection.close()
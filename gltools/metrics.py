@@ -0,0 +1,171 @@
+"""Prometheus metrics of export, setup and sync runs.
+
+At the end of a run the metrics are written in the text format read by
+the textfile collector of the Prometheus node exporter, e.g.::
+
+  glt export --metrics /var/lib/node_exporter/textfile/glt_export.prom homenet
+
+The file is replaced atomically, so the collector never reads a partial
+file. All metrics carry the ``command``, ``section`` and ``group`` labels:
+
+=========================================  ========================================
+Metric                                     Description
+=========================================  ========================================
+``gltools_run_duration_seconds``           wall time of the run
+``gltools_run_last_timestamp_seconds``     end of the run, in seconds since epoch
+``gltools_run_projects``                   projects per ``result``: ``succeeded``,
+                                           ``failed`` or ``skipped``
+``gltools_run_fetched_bytes``              bytes fetched for all projects
+``gltools_api_requests``                   API requests per ``server``, retries
+                                           included; 0 with an empty ``server``
+                                           when none were sent
+``gltools_project_success``                1 if the project succeeded, else 0
+``gltools_project_duration_seconds``       wall time per project
+``gltools_project_stage_duration_seconds`` wall time per project and ``stage``
+``gltools_project_fetched_bytes``          bytes the local repository of the
+                                           project grew by
+=========================================  ========================================
+
+Example::
+
+  from gltools.metrics import Metrics
+
+  metrics = Metrics('/tmp/glt.prom', 'export', 'local', 'homenet')
+  metrics.observe('project1', row)
+  metrics.write(results)
+"""
+
+import os
+import time
+import logging
+import threading
+
+from gltools.connections import requests_sent
+
+log = logging.getLogger('gltools.metrics')
+
+# row key of the bytes fetched for a project
+FETCHED = 'fetched_bytes'
+
+METRICS = [
+    ('gltools_run_duration_seconds', 'Wall time of the glt run.'),
+    ('gltools_run_last_timestamp_seconds', 'End of the glt run in seconds since the epoch.'),
+    ('gltools_run_projects', 'Projects handled by the glt run per result.'),
+    ('gltools_run_fetched_bytes', 'Bytes fetched for all projects of the glt run.'),
+    ('gltools_api_requests', 'GitLab API requests sent by the glt run, retries included.'),
+    ('gltools_project_success', 'Whether the project succeeded (1) or failed (0).'),
+    ('gltools_project_duration_seconds', 'Wall time spent on the project.'),
+    ('gltools_project_stage_duration_seconds', 'Wall time spent on a stage of the project.'),
+    ('gltools_project_fetched_bytes', 'Bytes the local repository of the project grew by.'),
+]
+
+
+def escape(value):
+    """escape a label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(**kwargs):
+    """format labels, sorted by name"""
+    return ",".join(['%s="%s"' % (key, escape(value))
+                     for key, value in sorted(kwargs.items())])
+
+
+class Metrics(object):
+    """Collects the metrics of a run
+
+    :param path: the file the metrics are written to
+    :param command: the glt command, e.g. ``export``
+    :param section: section in the python-gitlab configuration file
+    :param group: the source group
+    """
+
+    def __init__(self, path, command, section, group):
+        self.path = path
+        self.common = {'command': command, 'section': section, 'group': group}
+        self.start = time.time()
+        self.fetched = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, name, row):
+        """record what a job did for a project row
+
+        Pipelined jobs observe the row after every stage, so the values of
+        the row replace the ones recorded before instead of adding up.
+
+        :param name: label of the project, as used in the job results
+        :param row: project row
+        """
+        with self._lock:
+            if row.get(FETCHED) is not None:
+                self.fetched[name] = row[FETCHED]
+
+    def lines(self, results):
+        """the metrics of the run in the text exposition format
+
+        :param results: the job results of the run
+        :rtype: list
+        """
+        samples = dict([(name, list()) for name, _ in METRICS])
+
+        def sample(metric, value, **extra):
+            extra.update(self.common)
+            samples[metric].append("%s{%s} %s" % (metric, labels(**extra), value))
+
+        now = time.time()
+        counts = {'succeeded': 0, 'failed': 0, 'skipped': 0}
+        for result in results:
+            if not result.success:
+                counts['failed'] += 1
+            elif result.skipped:
+                counts['skipped'] += 1
+            else:
+                counts['succeeded'] += 1
+
+            sample('gltools_project_success', int(result.success), project=result.name)
+            sample('gltools_project_duration_seconds', "%.3f" % result.duration,
+                   project=result.name)
+            for stage, seconds in result.timings.items():
+                sample('gltools_project_stage_duration_seconds', "%.3f" % seconds,
+                       project=result.name, stage=stage)
+            if result.name in self.fetched:
+                sample('gltools_project_fetched_bytes', self.fetched[result.name],
+                       project=result.name)
+
+        sample('gltools_run_duration_seconds', "%.3f" % (now - self.start))
+        sample('gltools_run_last_timestamp_seconds', "%.3f" % now)
+        for result, count in sorted(counts.items()):
+            sample('gltools_run_projects', count, result=result)
+        sample('gltools_run_fetched_bytes', sum(self.fetched.values()))
+        requests = requests_sent() or {'': 0}
+        for server, count in sorted(requests.items()):
+            sample('gltools_api_requests', count, server=server)
+
+        lines = list()
+        for metric, description in METRICS:
+            if not samples[metric]:
+                continue
+            lines.append("# HELP %s %s" % (metric, description))
+            lines.append("# TYPE %s gauge" % metric)
+            lines.extend(samples[metric])
+        return lines
+
+    def write(self, results):
+        """write the metrics of the run, replacing the file atomically
+
+        :param results: the job results of the run
+        :type results: list of :class:`gltools.workers.JobResult`
+        """
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(dirname)
+
+        except OSError:
+            if not os.path.isdir(dirname):
+                raise
+
+        tmpfile = self.path + '.tmp'
+        with open(tmpfile, 'w') as stream:
+            stream.write("\n".join(self.lines(results)) + "\n")
+        os.rename(tmpfile, self.path)
+        log.debug("wrote %s" % self.path)
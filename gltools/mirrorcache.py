@@ -0,0 +1,41 @@
+"""Persistent cache of bare repository mirrors.
+
+Example::
+
+  from gltools.mirrorcache import MirrorCache
+
+  cache = MirrorCache('~/.cache/gltools/mirrors', 'local')
+  workflow = Workflow('fetch', [Mirror('%(url)s', cache.path)])
+"""
+
+import os
+import logging
+
+log = logging.getLogger('gltools.mirrorcache')
+
+
+class MirrorCache(object):
+    """Bare mirrors of the projects of a gitlab server
+
+    Every project is kept as ``<cachedir>/<servername>/<path_with_namespace>.git``.
+    The mirrors are created and updated by the
+    :class:`gltools.steps.Mirror` step, which only fetches what changed
+    since the previous run.
+
+    :param cachedir: top directory of the cache
+    :param servername: section in the python-gitlab configuration file
+    :type cachedir: str
+    :type servername: str
+    """
+
+    def __init__(self, cachedir, servername):
+        self.cachedir = os.path.expanduser(cachedir)
+        self.servername = servername
+
+    def path(self, row, key='path_with_namespace'):
+        """location of the mirror of the project in ``row``
+
+        :param row: project row
+        :param key: row key holding the full path of the project
+        """
+        return os.path.join(self.cachedir, self.servername, row[key] + '.git')
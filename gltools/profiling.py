@@ -0,0 +1,203 @@
+"""Phase timers and profiling of glt commands.
+
+Named phases (reading the configuration, listing projects, the steps of a
+workflow, ...) are timed with :func:`phase` and :func:`timed`. The totals
+are kept per process, summed over all threads, and reported by
+:class:`Profiler`, which runs the command under ``cProfile`` (and
+optionally ``tracemalloc``) when ``glt --profile FILE`` is used.
+
+Example::
+
+  from gltools.profiling import phase, timed
+
+  with phase('config'):
+      cfg = GitLabToolsConfig()
+
+  for row in timed('list projects', gitlab.projects('homenet')):
+      ...
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+import pstats
+import logging
+import cProfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+log = logging.getLogger('gltools.profiling')
+
+# number of functions and allocation sites in the summary
+TOP = 20
+
+_lock = threading.Lock()
+_phases = dict()
+_order = list()
+
+
+def record(name, seconds):
+    """add ``seconds`` to the total of phase ``name``"""
+    with _lock:
+        if name not in _phases:
+            _phases[name] = [0, 0.0]
+            _order.append(name)
+        _phases[name][0] += 1
+        _phases[name][1] += seconds
+
+
+@contextmanager
+def phase(name):
+    """time the enclosed block as phase ``name``"""
+    start = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.time() - start
+        record(name, seconds)
+        log.debug("phase %s: %.3fs" % (name, seconds))
+
+
+def timed(name, iterable):
+    """yield from ``iterable``, timing the production of the items as phase
+    ``name``
+
+    Useful for generators, whose work only happens while they are consumed.
+    The time the consumer spends on an item is not included.
+    """
+    iterator = iter(iterable)
+    spent = 0.0
+    try:
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+
+            except StopIteration:
+                spent += time.time() - start
+                break
+
+            spent += time.time() - start
+            yield item
+    finally:
+        record(name, spent)
+        log.debug("phase %s: %.3fs" % (name, spent))
+
+
+def phases():
+    """the phases timed so far in order of first use
+
+    :returns: ``(name, count, seconds)`` tuples
+    :rtype: list
+    """
+    with _lock:
+        return [(name, _phases[name][0], _phases[name][1]) for name in _order]
+
+
+def reset():
+    """forget all phase timings"""
+    with _lock:
+        _phases.clear()
+        del _order[:]
+
+
+class Profiler(object):
+    """Profile the command with ``cProfile`` and report a summary
+
+    Every thread started while profiling gets a profiler of its own; the
+    statistics of all threads are combined in a single ``.pstats`` file,
+    which can be inspected with ``python -m pstats FILE`` or e.g. snakeviz.
+
+    :param path: the ``.pstats`` file to write
+    :param top: number of functions and allocation sites in the summary
+    :param memory: also trace memory allocations with ``tracemalloc``
+    :param stream: where the summary is written, defaults to stderr
+    """
+
+    def __init__(self, path, top=TOP, memory=False, stream=None):
+        self.path = path
+        self.top = top
+        self.memory = memory
+        self.stream = stream or sys.stderr
+        self.profile = cProfile.Profile()
+        self.profiles = list()
+        self.start_time = None
+        self._lock = threading.Lock()
+
+        if self.memory and tracemalloc is None:
+            log.warning("tracemalloc is not available, memory is not traced")
+            self.memory = False
+
+    def _threadhook(self, frame, event, arg):
+        # called once in every new thread, replaced by a profiler of its own
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+
+        # python 3.12 and up profile all threads with the first profiler
+        except ValueError:
+            return
+
+        with self._lock:
+            self.profiles.append(profile)
+
+    def start(self):
+        reset()
+        if self.memory:
+            tracemalloc.start()
+        threading.setprofile(self._threadhook)
+        self.start_time = time.time()
+        self.profile.enable()
+
+    def stop(self):
+        """stop profiling, write the statistics and the summary"""
+        self.profile.disable()
+        wall = time.time() - self.start_time
+        threading.setprofile(None)
+
+        snapshot = peak = None
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        stats = pstats.Stats(self.profile, stream=self.stream)
+        with self._lock:
+            for profile in self.profiles:
+                profile.disable()
+                try:
+                    stats.add(profile)
+
+                # a thread that never made a call has nothing to add
+                except TypeError:
+                    pass
+
+        stats.dump_stats(self.path)
+        self.summary(stats, wall, snapshot, peak)
+
+    def summary(self, stats, wall, snapshot=None, peak=None):
+        out = self.stream
+        print("\nprofile written to %s (%.3fs wall, %d threads)" %
+              (self.path, wall, len(self.profiles) + 1), file=out)
+
+        timings = phases()
+        if timings:
+            print("\nphases (seconds summed over threads):", file=out)
+            for name, count, seconds in timings:
+                print("  %-32s %6d x %10.3fs" % (name, count, seconds), file=out)
+
+        print("\ntop %d functions by cumulative time:" % self.top, file=out)
+        stats.sort_stats('cumulative').print_stats(self.top)
+
+        if snapshot is not None:
+            print("memory: peak %.1f MiB, top %d allocation sites:" %
+                  (peak / 1048576.0, self.top), file=out)
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                print("  %s" % stat, file=out)
@@ -0,0 +1,150 @@
+"""Compact records of GitLab objects.
+
+A listing of a large group holds thousands of projects. Instead of
+python-gitlab objects, which keep the full API representation, every
+project is kept as a :class:`ProjectRecord` with just the fields gltools
+uses. Records behave like the dicts used before, so ``"%(name)s" % record``
+and ``record['url'] = ...`` keep working; keys that are not fields end up
+in a small overflow dict.
+
+Example::
+
+  from gltools.records import ProjectRecord
+
+  record = ProjectRecord.from_attrs(attrs)
+  record['type'] = 'bundle'
+  print("%(path_with_namespace)s %(type)s" % record)
+"""
+
+__all__ = ['ProjectRecord']
+
+
+class ProjectRecord(object):
+    """A project as used by gltools
+
+    +---------------------+------------------------------------------+
+    | Name                | value source                             |
+    +=====================+==========================================+
+    | group_id            | ``namespace['id']``                      |
+    +---------------------+------------------------------------------+
+    | group_name          | ``namespace['name']``                    |
+    +---------------------+------------------------------------------+
+    | group_path          | ``namespace['full_path']``               |
+    +---------------------+------------------------------------------+
+    | relpath             | namespace relative to the listed group   |
+    +---------------------+------------------------------------------+
+
+    The other fields are taken from the project attributes of the same
+    name.
+
+    :param kwargs: field values, other keys are kept as extra values
+    """
+
+    FIELDS = ('id', 'name', 'path', 'description', 'name_with_namespace',
+              'path_with_namespace', 'ssh_url_to_repo', 'http_url_to_repo',
+              'last_activity_at', 'group_id', 'group_name', 'group_path',
+              'relpath')
+
+    __slots__ = FIELDS + ('_extra',)
+
+    def __init__(self, **kwargs):
+        for field in self.FIELDS:
+            setattr(self, field, kwargs.pop(field, None))
+        self._extra = kwargs or None
+
+    @classmethod
+    def from_attrs(cls, attrs):
+        """create a record from the API representation of a project, the
+        ``relpath`` is left empty for the listing to fill in
+
+        :param attrs: project attributes
+        :type attrs: dict
+        :rtype: ProjectRecord
+        """
+        namespace = attrs.get('namespace') or dict()
+        return cls(id=attrs.get('id'),
+                   name=attrs.get('name'),
+                   path=attrs.get('path'),
+                   description=attrs.get('description'),
+                   name_with_namespace=attrs.get('name_with_namespace'),
+                   path_with_namespace=attrs.get('path_with_namespace'),
+                   ssh_url_to_repo=attrs.get('ssh_url_to_repo'),
+                   http_url_to_repo=attrs.get('http_url_to_repo'),
+                   last_activity_at=attrs.get('last_activity_at'),
+                   group_id=namespace.get('id'),
+                   group_name=namespace.get('name'),
+                   group_path=namespace.get('full_path'),
+                   relpath='')
+
+    @classmethod
+    def from_dict(cls, data):
+        """create a record from a dict, e.g. one read from the cache
+
+        :rtype: ProjectRecord
+        """
+        return cls(**dict(data))
+
+    def to_dict(self):
+        """return the record as a plain dict
+
+        :rtype: dict
+        """
+        return dict(self.items())
+
+    def keys(self):
+        keys = list(self.FIELDS)
+        if self._extra:
+            keys.extend(self._extra.keys())
+        return keys
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+            return
+        if self._extra is None:
+            self._extra = dict()
+        self._extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.FIELDS or bool(self._extra and key in self._extra)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        try:
+            return self.to_dict() == dict(other)
+
+        except (TypeError, ValueError):
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "<ProjectRecord %s>" % self.path_with_namespace
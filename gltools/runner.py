@@ -0,0 +1,189 @@
+"""Streaming execution of external commands.
+
+Output of the command is read while it runs and handed, line by line, to the
+log or a callback. Only a bounded tail of the output is kept for the error
+message, so memory use does not depend on how much a command prints. A
+command that runs longer than its timeout is killed, together with the
+processes it started (e.g. the ssh process of a ``git fetch``).
+
+Example::
+
+  from gltools.runner import run
+
+  lines = run(['git', 'ls-remote', url], capture=True, timeout=60)
+  run(['ansible-galaxy', 'install', '-r', 'requirements.yml'],
+      callback=lambda line, stream: print(line))
+"""
+
+import os
+import sys
+import signal
+import logging
+import threading
+import subprocess
+from collections import deque
+
+from gltools.exceptions import GLToolsException
+from gltools.workers import attributed
+
+log = logging.getLogger('gltools.runner')
+
+# number of output lines kept for the error message of a failing command
+TAIL = 20
+
+# seconds the output of a killed command is still read, processes that left
+# its process group may keep the pipes open for good
+GRACE = 5
+
+# start commands in a session, and process group, of their own
+if sys.version_info[0] >= 3:
+    SESSION = {'start_new_session': True}
+else:
+    SESSION = {'preexec_fn': os.setsid}
+
+
+def _decode(line):
+    if not isinstance(line, str):
+        line = line.decode('utf-8', 'replace')
+    return line.rstrip('\r\n')
+
+
+def _pump(stream, handler):
+    """feed every line of ``stream`` to ``handler`` until it is exhausted"""
+    try:
+        while True:
+            line = stream.readline()
+            if not line:
+                break
+            handler(_decode(line))
+    finally:
+        stream.close()
+
+
+def _join(thread, expired):
+    """wait for a reader thread, at most :data:`GRACE` seconds once the
+    command was killed"""
+    while thread.is_alive():
+        if expired.is_set():
+            thread.join(GRACE)
+            return
+        thread.join(0.5)
+
+
+def run(command, cwd=None, env=None, timeout=None, capture=False,
+        callback=None, consume=None, logger=None, tail=TAIL):
+    """Run a command, streaming its output.
+
+    :param command: the command and its arguments
+    :param cwd: working directory
+    :param env: environment, defaults to the current one
+    :param timeout: seconds after which the command is killed, None or 0
+                    means no limit
+    :param capture: return the stdout lines; leave it off for commands that
+                    are only run for their effect
+    :param callback: called as ``callback(line, stream)`` for every output
+                     line, ``stream`` is ``stdout`` or ``stderr``. Lines are
+                     logged at debug level when no callback is given.
+    :param consume: callable that reads the raw stdout stream itself, e.g.
+                    to unpack binary output; ``capture`` and ``callback``
+                    then only apply to stderr
+    :param logger: logger used for the output lines
+    :param tail: number of output lines kept for the error message
+    :type command: list
+    :type timeout: int
+    :returns: the stdout lines when ``capture`` is set, otherwise an empty list
+    :rtype: list
+    :raise: GLToolsException when the command fails or times out
+    """
+    logger = logger or log
+    captured = list()
+    lasts = deque(maxlen=tail)
+    lock = threading.Lock()
+    expired = threading.Event()
+
+    def handler(stream):
+        def handle(line):
+            with lock:
+                lasts.append(line)
+            if capture and stream == 'stdout':
+                captured.append(line)
+            if callback is not None:
+                callback(line, stream)
+            else:
+                logger.debug(line)
+        return handle
+
+    logger.debug("  execute %s" % " ".join(command))
+    process = subprocess.Popen(command, cwd=cwd, env=env,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, **SESSION)
+
+    def killgroup():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+
+        except OSError:
+            pass
+
+    def kill():
+        expired.set()
+        killgroup()
+
+    failures = list()
+
+    def output():
+        if consume is None:
+            _pump(process.stdout, handler('stdout'))
+            return
+
+        try:
+            consume(process.stdout)
+
+        # the consumer failing must not leave the command running
+        except Exception as err:  # pylint: disable=W0703
+            failures.append(err)
+            killgroup()
+        finally:
+            process.stdout.close()
+
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+
+    readers = [threading.Thread(target=attributed(output)),
+               threading.Thread(target=attributed(_pump),
+                                args=(process.stderr, handler('stderr')))]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+
+    try:
+        for reader in readers:
+            _join(reader, expired)
+        process.wait()
+
+    # the command does not get the Ctrl-C of the terminal, it is in a
+    # process group of its own
+    except BaseException:
+        killgroup()
+        raise
+
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    consumed = failures[0] if failures else None
+    if consumed is not None and not expired.is_set():
+        raise GLToolsException("%s\n\n%s" % (consumed, "\n".join(lasts)))
+
+    if expired.is_set():
+        raise GLToolsException("%s timed out after %ss\n\n%s" %
+                               (command[0], timeout, "\n".join(lasts)))
+
+    if process.returncode != 0:
+        raise GLToolsException("%s exited with %d\n\n%s" %
+                               (" ".join(command), process.returncode,
+                                "\n".join(lasts)))
+    return captured
@@ -0,0 +1,373 @@
+"""In-process step engine for the export and sync workflows.
+
+A workflow is a list of typed steps that run in order against a project
+row. Step arguments are either ``%(key)s`` templates, formatted with the
+row just like the shell templates used to be, or callables taking the row.
+A failing step raises :class:`gltools.exceptions.GLToolsStepException`
+carrying the step name and a stable reason code, so callers can tell *why*
+a project failed without parsing script exit codes.
+
+Example::
+
+  from gltools.steps import Workflow, MakeDirs, Bundle
+
+  workflow = Workflow('export', [
+      MakeDirs('%(outputdir)s/%(group_path)s'),
+      Bundle('%(mirror)s', '%(outputdir)s/%(group_path)s/%(path)s.bundle'),
+  ])
+  timings = workflow.run(row)
+"""
+
+import os
+import time
+import shutil
+import logging
+import tarfile
+from abc import ABCMeta, abstractmethod
+
+from gltools.git import Git
+from gltools.runner import run
+from gltools.profiling import record
+from gltools.bundlechain import BundleChain, FULL, INCREMENTAL
+from gltools.exceptions import GLToolsException, GLToolsStepException
+
+log = logging.getLogger('gltools.steps')
+
+# base class with ABCMeta as its metaclass on python 2 and 3
+ABC = ABCMeta('ABC', (object,), {})
+
+
+def resolve(spec, row):
+    """resolve a step argument against ``row``
+
+    :param spec: callable taking the row, ``%(key)s`` template or None
+    :param row: project row
+    """
+    if spec is None:
+        return None
+    if callable(spec):
+        return spec(row)
+    return spec % row
+
+
+class Step(ABC):
+    """A single step of a workflow, subclasses implement :meth:`run`
+
+    :param name: name of the step, used in logging and errors
+    :param when: optional callable taking the row, the step is skipped when
+                 it returns False
+    :param always: also run the step after an earlier step failed, e.g. for
+                   cleanup
+    """
+
+    reason = 'failed'
+
+    def __init__(self, name=None, when=None, always=False):
+        self.name = name or self.__class__.__name__.lower()
+        self.when = when
+        self.always = always
+
+    def applies(self, row):
+        """whether the step should run for ``row``"""
+        return self.when is None or self.when(row)
+
+    @abstractmethod
+    def run(self, row, git):
+        """execute the step
+
+        :param row: project row
+        :param git: :class:`gltools.git.Git` instance of the workflow
+        :raise: GLToolsException on fail
+        """
+
+
+class MakeDirs(Step):
+    """Create a directory (and its parents) if it does not exist"""
+
+    reason = 'mkdir'
+
+    def __init__(self, path, **kwargs):
+        super(MakeDirs, self).__init__(**kwargs)
+        self.path = path
+
+    def run(self, row, git):
+        path = resolve(self.path, row)
+        try:
+            os.makedirs(path)
+
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+
+class Mirror(Step):
+    """Create or update a bare mirror and store its path in the row
+
+    :param url: url of the source repository
+    :param path: location of the mirror
+    :param key: row key the path of the mirror is stored in
+    :param sizekey: row key the growth of the mirror in bytes is stored in,
+                    not measured when None
+    """
+
+    reason = 'fetch'
+
+    def __init__(self, url, path, key='mirror', sizekey=None, **kwargs):
+        super(Mirror, self).__init__(**kwargs)
+        self.url = url
+        self.path = path
+        self.key = key
+        self.sizekey = sizekey
+
+    def run(self, row, git):
+        path = resolve(self.path, row)
+        if self.sizekey is not None:
+            before = git.size(path)
+
+        row[self.key] = git.mirror(resolve(self.url, row), path)
+
+        if self.sizekey is not None:
+            row[self.sizekey] = max(0, git.size(path) - before)
+
+
+class PushChanged(Step):
+    """Push the refs of a local repository that differ from a remote one and
+    store the pushed refs in the row
+
+    :param path: location of the local repository
+    :param url: url of the remote repository
+    :param key: row key the list of pushed refs is stored in
+    """
+
+    reason = 'push'
+
+    def __init__(self, path, url, key='pushed', **kwargs):
+        super(PushChanged, self).__init__(**kwargs)
+        self.path = path
+        self.url = url
+        self.key = key
+
+    def run(self, row, git):
+        row[self.key] = git.push_changed(resolve(self.path, row),
+                                         resolve(self.url, row))
+
+
+class Bundle(Step):
+    """Create a git bundle of a branch
+
+    :param repository: location of the (bare) repository
+    :param bundlefile: the bundle to create
+    :param ref: what to bundle
+    """
+
+    reason = 'bundle'
+
+    def __init__(self, repository, bundlefile, ref='master', **kwargs):
+        super(Bundle, self).__init__(**kwargs)
+        self.repository = repository
+        self.bundlefile = bundlefile
+        self.ref = ref
+
+    def run(self, row, git):
+        git.git("--git-dir=%s" % resolve(self.repository, row), "bundle", "create",
+                resolve(self.bundlefile, row), resolve(self.ref, row))
+
+
+class IncrementalBundle(Bundle):
+    """Add a bundle with the commits since the previous export to a
+    :class:`gltools.bundlechain.BundleChain`
+
+    A full bundle is made for the first export, after ``chain``
+    incremental bundles and when the previous tip is no longer part of the
+    history of ``ref``. Nothing is written when ``ref`` did not move.
+
+    :param repository: location of the (bare) repository
+    :param directory: directory of the chain
+    :param prefix: prefix of the bundle file names
+    :param project: description of the project stored in the manifest
+    :param ref: what to bundle
+    :param chain: number of incremental bundles before the next full one
+    """
+
+    def __init__(self, repository, directory, prefix, project=None, ref='master',
+                 chain=7, **kwargs):
+        super(IncrementalBundle, self).__init__(repository, directory, ref=ref,
+                                                **kwargs)
+        self.prefix = prefix
+        self.project = project
+        self.chain = chain
+
+    def run(self, row, git):
+        repository = resolve(self.repository, row)
+        directory = resolve(self.bundlefile, row)
+        ref = resolve(self.ref, row)
+        MakeDirs(directory).run(row, git)
+
+        bundles = BundleChain(directory, resolve(self.prefix, row),
+                              project=resolve(self.project, row), ref=ref)
+        tip = git.rev_parse(repository, ref)
+        basis = bundles.tip
+
+        if basis == tip:
+            log.debug("%s did not change since %s" % (ref, tip))
+            return
+
+        kind = INCREMENTAL
+        if basis is None or bundles.increments >= self.chain:
+            kind = FULL
+        elif not git.is_ancestor(repository, basis, tip):
+            log.info("%s was rewritten, starting a new chain" % ref)
+            kind = FULL
+
+        filename = bundles.filename(kind)
+        tmpfile = os.path.join(directory, filename + '.tmp')
+        args = ["--git-dir=%s" % repository, "bundle", "create", tmpfile, ref]
+        if kind == INCREMENTAL:
+            args.append("^%s" % basis)
+
+        try:
+            git.git(*args)
+            os.rename(tmpfile, os.path.join(directory, filename))
+
+        except (GLToolsException, EnvironmentError):
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            raise
+
+        bundles.add(filename, kind, None if kind == FULL else basis, tip)
+        row['bundle'] = filename
+
+
+class Archive(Step):
+    """Extract ``git archive`` output into a directory
+
+    The tar stream is unpacked in-process, no ``tar`` process is started.
+
+    :param repository: location of the (bare) repository
+    :param destination: directory to extract into
+    :param prefix: directory the content is placed in
+    :param ref: what to archive
+    """
+
+    reason = 'archive'
+
+    def __init__(self, repository, destination, prefix, ref='HEAD', **kwargs):
+        super(Archive, self).__init__(**kwargs)
+        self.repository = repository
+        self.destination = destination
+        self.prefix = prefix
+        self.ref = ref
+
+    def run(self, row, git):
+        destination = resolve(self.destination, row)
+
+        def extract(stream):
+            tar = tarfile.open(fileobj=stream, mode='r|')
+            try:
+                if hasattr(tarfile, 'tar_filter'):
+                    tar.extractall(destination, filter='tar')
+                else:
+                    tar.extractall(destination)
+            finally:
+                tar.close()
+
+        git.git("--git-dir=%s" % resolve(self.repository, row),
+                "archive", "--format=tar",
+                "--prefix=%s/" % resolve(self.prefix, row),
+                resolve(self.ref, row), consume=extract)
+
+
+class Command(Step):
+    """Run an external command
+
+    :param command: list of arguments, each resolved against the row
+    :param cwd: working directory
+    :param reason: reason code reported on failure
+    """
+
+    def __init__(self, command, cwd=None, reason='command', **kwargs):
+        super(Command, self).__init__(**kwargs)
+        self.command = command
+        self.cwd = cwd
+        self.reason = reason
+
+    def run(self, row, git):
+        command = [resolve(x, row) for x in self.command]
+        command[0] = git.which(command[0])
+        run(command, cwd=resolve(self.cwd, row), timeout=git.timeout,
+            logger=git.logger)
+
+
+class Remove(Step):
+    """Remove a directory tree, also after a failing step"""
+
+    reason = 'cleanup'
+
+    def __init__(self, path, **kwargs):
+        kwargs.setdefault('always', True)
+        super(Remove, self).__init__(**kwargs)
+        self.path = path
+
+    def run(self, row, git):
+        shutil.rmtree(resolve(self.path, row), ignore_errors=True)
+
+
+class Workflow(object):
+    """An ordered list of steps
+
+    :param name: name of the workflow
+    :param steps: the steps
+    :param git: :class:`gltools.git.Git` instance the steps use
+    :type name: str
+    :type steps: list of :class:`Step`
+    """
+
+    def __init__(self, name, steps, git=None):
+        self.name = name
+        self.steps = steps
+        self.git = git or Git()
+
+    def run(self, row):
+        """run all applicable steps against ``row``
+
+        After a failing step only the steps marked ``always`` are run.
+
+        :param row: project row
+        :returns: seconds spent per step
+        :rtype: list of tuple
+        :raise: GLToolsStepException on the first failing step
+        """
+        timings = list()
+        failure = None
+        for step in self.steps:
+            if failure is not None and not step.always:
+                continue
+
+            if not step.applies(row):
+                continue
+
+            log.debug("%s %s, start" % (self.name, step.name))
+            start = time.time()
+            try:
+                step.run(row, self.git)
+
+            except GLToolsStepException as err:
+                failure = failure or err
+                continue
+
+            except (GLToolsException, EnvironmentError) as err:
+                message = getattr(err, 'message', None) or str(err)
+                failure = failure or GLToolsStepException(
+                    "%s %s" % (self.name, step.name), step.reason, message)
+                continue
+
+            finally:
+                elapsed = time.time() - start
+                record("%s %s" % (self.name, step.name), elapsed)
+
+            timings.append((step.name, elapsed))
+            log.debug("%s %s, end" % (self.name, step.name))
+
+        if failure is not None:
+            raise failure
+        return timings
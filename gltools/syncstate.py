@@ -0,0 +1,123 @@
+"""Watermarks of earlier sync runs.
+
+For every source/destination pair a small json file records, per project,
+the ``last_activity_at`` of the source project and the head SHAs that were
+synced. A later run can use it to skip projects that did not change.
+
+Example::
+
+  from gltools.syncstate import SyncState
+
+  state = SyncState('local:homenet', 'remote:homenet')
+  if not state.unchanged('role-common', '2020-01-01T00:00:00Z'):
+      ...
+      state.record('role-common', '2020-01-01T00:00:00Z', {'master': sha})
+  state.save()
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+
+log = logging.getLogger('gltools.syncstate')
+
+STATEDIR = os.path.expanduser('~/.cache/gltools/syncstate')
+
+
+class SyncState(object):
+    """Sync watermarks for a single source/destination pair
+
+    :param source: description of the source, e.g. ``section:group``
+    :param destination: description of the destination
+    :param statedir: directory holding the state files
+    :type source: str
+    :type destination: str
+    :type statedir: str
+    """
+
+    def __init__(self, source, destination, statedir=None):
+        self.source = source
+        self.destination = destination
+        self.statedir = os.path.expanduser(statedir or STATEDIR)
+        self.projects = dict()
+        self._lock = threading.Lock()
+        self.load()
+
+    @property
+    def statefile(self):
+        """full path of the state file of this pair"""
+        name = "%s__%s" % (self.source, self.destination)
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name)
+        return os.path.join(self.statedir, name + '.json')
+
+    def load(self):
+        """load the state file, a missing or unreadable file means an empty
+        state"""
+        if not os.path.exists(self.statefile):
+            return
+
+        try:
+            with open(self.statefile) as stream:
+                data = json.load(stream)
+
+        except (IOError, ValueError) as err:
+            log.warning("ignoring state file %s: %s" % (self.statefile, err))
+            return
+
+        self.projects = data.get('projects', dict())
+
+    def save(self):
+        """write the state file"""
+        try:
+            os.makedirs(self.statedir)
+
+        except OSError:
+            if not os.path.isdir(self.statedir):
+                raise
+
+        data = {'source': self.source,
+                'destination': self.destination,
+                'projects': self.projects}
+
+        tmpfile = self.statefile + '.tmp'
+        with self._lock:
+            with open(tmpfile, 'w') as stream:
+                json.dump(data, stream, indent=2, sort_keys=True)
+            os.rename(tmpfile, self.statefile)
+        log.debug("wrote %s" % self.statefile)
+
+    def get(self, key):
+        """return the recorded watermark of a project, if any
+
+        :rtype: dict or None
+        """
+        return self.projects.get(key)
+
+    def unchanged(self, key, last_activity_at):
+        """check whether the project was synced at the given activity
+
+        :param key: project key, e.g. its path
+        :param last_activity_at: ``last_activity_at`` of the source project
+        :rtype: bool
+        """
+        entry = self.get(key)
+        if not entry or not entry.get('heads') or last_activity_at is None:
+            return False
+        return entry.get('last_activity_at') == last_activity_at
+
+    def record(self, key, last_activity_at, heads):
+        """record a successful sync of a project
+
+        :param key: project key, e.g. its path
+        :param last_activity_at: ``last_activity_at`` of the source project
+        :param heads: mapping of synced refs to their SHA
+        :type heads: dict
+        """
+        with self._lock:
+            self.projects[key] = {'last_activity_at': last_activity_at,
+                                  'heads': heads,
+                                  'synced_at': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                                             time.gmtime())}
@@ -0,0 +1,182 @@
+"""Tracing of GitLab API requests.
+
+While a :class:`Tracer` is active every request sent through the
+connections of :mod:`gltools.connections` is recorded with its endpoint,
+page, status, latency and response size; retries are recorded as separate
+requests. ``glt -v`` logs a summary per endpoint at the end of the
+command, ``glt --trace FILE`` also writes every request as a line of JSON.
+
+Endpoints are the request paths with ids and group paths replaced, so all
+pages of all groups end up under e.g. ``GET /groups/:id/projects``.
+
+Example::
+
+  from gltools import tracing
+
+  tracer = tracing.start()
+  ...
+  tracer.report()
+  tracer.dump('/tmp/glt-trace.jsonl')
+  tracing.stop()
+"""
+
+import json
+import time
+import logging
+import threading
+
+try:
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from urlparse import urlparse, parse_qs
+
+from gltools.workers import current_project
+
+log = logging.getLogger('gltools.tracing')
+
+# path segments followed by an id or an url encoded path
+COLLECTIONS = frozenset(['groups', 'projects', 'users', 'namespaces',
+                         'subgroups', 'members', 'hooks', 'branches', 'tags'])
+
+_tracer = None
+
+
+def endpoint(path):
+    """the endpoint of a request path, e.g. ``/groups/:id/projects`` for
+    ``/api/v4/groups/homenet%2Froles/projects``
+
+    :rtype: str
+    """
+    parts = [x for x in path.split('/') if x]
+    if len(parts) >= 2 and parts[0] == 'api':
+        parts = parts[2:]
+
+    index = 0
+    while index < len(parts):
+        if parts[index] in COLLECTIONS and index + 1 < len(parts):
+            parts[index + 1] = ':id'
+            index += 1
+        index += 1
+    return '/' + '/'.join(parts)
+
+
+class Tracer(object):
+    """Records the API requests of a run"""
+
+    def __init__(self):
+        self.start = time.time()
+        self.calls = list()
+        self._lock = threading.Lock()
+
+    def record(self, method, url, status, seconds, size, attempt=0):
+        """record a single request
+
+        :param method: HTTP method
+        :param url: the requested url
+        :param status: HTTP status, None when no response was received
+        :param seconds: latency, up to the end of the response body
+        :param size: bytes in the response body
+        :param attempt: number of earlier attempts of the same request
+        """
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        page = query.get('page', [None])[0]
+        call = {'time': round(time.time() - self.start - seconds, 4),
+                'project': current_project(),
+                'method': method,
+                'endpoint': endpoint(parsed.path),
+                'path': parsed.path,
+                'query': parsed.query,
+                'page': int(page) if page and page.isdigit() else page,
+                'status': status,
+                'seconds': round(seconds, 4),
+                'bytes': size,
+                'attempt': attempt}
+        with self._lock:
+            self.calls.append(call)
+
+    def summary(self):
+        """per endpoint totals, busiest endpoint first
+
+        :returns: dicts with ``method``, ``endpoint``, ``requests``,
+                  ``errors``, ``pages`` (highest page number seen),
+                  ``bytes``, ``seconds`` and ``max``
+        :rtype: list
+        """
+        totals = dict()
+        with self._lock:
+            calls = list(self.calls)
+
+        for call in calls:
+            key = (call['method'], call['endpoint'])
+            if key not in totals:
+                totals[key] = {'method': call['method'], 'endpoint': call['endpoint'],
+                               'requests': 0, 'errors': 0, 'pages': 0,
+                               'bytes': 0, 'seconds': 0.0, 'max': 0.0}
+            total = totals[key]
+            total['requests'] += 1
+            if call['status'] is None or call['status'] >= 400:
+                total['errors'] += 1
+            if isinstance(call['page'], int):
+                total['pages'] = max(total['pages'], call['page'])
+            total['bytes'] += call['bytes'] or 0
+            total['seconds'] += call['seconds']
+            total['max'] = max(total['max'], call['seconds'])
+
+        return sorted(totals.values(), key=lambda x: x['seconds'], reverse=True)
+
+    def report(self, logger=None):
+        """log the per endpoint summary"""
+        logger = logger or log
+        rows = self.summary()
+        if not rows:
+            logger.info("api: no requests")
+            return
+
+        logger.info("api: %-40s %6s %6s %6s %10s %9s %9s" %
+                    ('endpoint', 'reqs', 'errors', 'pages', 'bytes', 'total', 'max'))
+        for row in rows:
+            logger.info("api: %-40s %6d %6d %6s %10d %8.3fs %8.3fs" %
+                        ("%s %s" % (row['method'], row['endpoint']), row['requests'],
+                         row['errors'], row['pages'] or '-', row['bytes'],
+                         row['seconds'], row['max']))
+
+        logger.info("api: %d requests, %d bytes, %.3fs (summed over threads)" %
+                    (sum([x['requests'] for x in rows]),
+                     sum([x['bytes'] for x in rows]),
+                     sum([x['seconds'] for x in rows])))
+
+    def dump(self, path):
+        """write every request as a line of JSON to ``path``"""
+        with self._lock:
+            calls = list(self.calls)
+
+        with open(path, 'w') as stream:
+            for call in calls:
+                stream.write(json.dumps(call, sort_keys=True) + "\n")
+        log.debug("wrote %d requests to %s" % (len(calls), path))
+
+
+def start():
+    """start tracing, or return the tracer that is already active
+
+    :rtype: Tracer
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def current():
+    """the active tracer
+
+    :rtype: Tracer or None
+    """
+    return _tracer
+
+
+def stop():
+    """stop tracing"""
+    global _tracer
+    _tracer = None
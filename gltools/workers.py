@@ -0,0 +1,419 @@
+"""Bounded worker pool used to process projects concurrently.
+
+The pool consumes its input lazily through a bounded queue so a (possibly
+streaming) list of projects is never read further ahead than the workers can
+handle. Every job is attributed to a project; log records emitted while a job
+runs carry the project label so interleaved output stays readable.
+
+Example::
+
+  from gltools.workers import WorkerPool
+
+  pool = WorkerPool(jobs=4)
+  results = pool.map(setup_project, rows, label=lambda row: row['name'])
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+log = logging.getLogger('gltools.workers')
+
+_context = threading.local()
+
+
+class Skipped(object):
+    """Type of :data:`SKIPPED`"""
+
+    def __repr__(self):
+        return "SKIPPED"
+
+
+# returned by a job or a pipeline stage for a row that needed no work, the
+# row does not enter later stages and is reported as skipped
+SKIPPED = Skipped()
+
+
+def current_project():
+    """return the label of the project handled by the current thread
+
+    :rtype: str or None
+    """
+    return getattr(_context, 'project', None)
+
+
+def attributed(func):
+    """wrap ``func`` for a thread started on behalf of the current thread,
+    so its work and log records are attributed to the same project
+
+    :param func: the target of the thread
+    """
+    project = current_project()
+
+    def target(*args, **kwargs):
+        _context.project = project
+        return func(*args, **kwargs)
+    return target
+
+
+class ProjectLogFilter(logging.Filter):
+    """Adds a ``project`` attribute to log records so formatters can
+    attribute messages to the project being handled by the emitting thread.
+    """
+
+    def filter(self, record):
+        project = current_project()
+        if project is None:
+            record.project = ""
+        else:
+            record.project = "[%s] " % project
+        return True
+
+
+class JobResult(object):
+    """Outcome of a single job
+
+    :param name: label of the project
+    :param success: whether the job finished without raising
+    :param duration: wall clock time in seconds
+    :param error: the exception raised by the job, if any
+    :param value: the return value of the job, if any
+    :param timings: seconds spent per stage for pipelined jobs
+    """
+
+    def __init__(self, name, success, duration, error=None, value=None,
+                 timings=None):
+        self.name = name
+        self.success = success
+        self.duration = duration
+        self.error = error
+        self.value = value
+        self.timings = timings or dict()
+
+    @property
+    def skipped(self):
+        """whether the job returned :data:`SKIPPED`"""
+        return self.success and self.value is SKIPPED
+
+    def __repr__(self):
+        return "<JobResult %s success=%s duration=%.2f>" % (self.name,
+                                                             self.success,
+                                                             self.duration)
+
+
+class WorkerPool(object):
+    """Run a function over a list of rows with at most ``jobs`` threads.
+
+    :param jobs: maximum number of concurrent jobs
+    :type jobs: int
+
+    With ``jobs=1`` everything runs in the calling thread, which keeps the
+    serial behaviour (and tracebacks) identical to a plain loop.
+
+    The results of the jobs that finished are available from
+    :meth:`results` while :meth:`map` runs, and after it was interrupted.
+    """
+
+    def __init__(self, jobs=1):
+        self.jobs = max(1, int(jobs or 1))
+        self._results = dict()
+        self._lock = threading.Lock()
+
+    def results(self):
+        """the results of the jobs that finished so far, in input order
+
+        :rtype: list of :class:`JobResult`
+        """
+        with self._lock:
+            return [self._results[index] for index in sorted(self._results)]
+
+    @staticmethod
+    def _label(row, label):
+        if label is not None:
+            return label(row)
+        try:
+            return row.get('name')
+        except AttributeError:
+            return str(row)
+
+    def _run(self, func, row, name):
+        previous = current_project()
+        _context.project = name
+        start = time.time()
+        try:
+            value = func(row)
+
+        # pylint: disable=W0703
+        except Exception as err:
+            log.error("failed: %s" % err)
+            return JobResult(name, False, time.time() - start, error=err)
+
+        finally:
+            _context.project = previous
+
+        return JobResult(name, True, time.time() - start, value=value)
+
+    def map(self, func, rows, label=None):
+        """Apply ``func`` to every row.
+
+        :param func: callable taking a single row
+        :param rows: iterable of rows, consumed lazily
+        :param label: optional callable returning the label of a row
+        :returns: results in input order
+        :rtype: list of :class:`JobResult`
+        """
+        with self._lock:
+            self._results.clear()
+
+        if self.jobs == 1:
+            for index, row in enumerate(rows):
+                result = self._run(func, row, self._label(row, label))
+                with self._lock:
+                    self._results[index] = result
+            return self.results()
+
+        inbox = queue.Queue(maxsize=self.jobs * 2)
+
+        def worker():
+            while True:
+                item = inbox.get()
+                if item is None:
+                    break
+                index, row = item
+                result = self._run(func, row, self._label(row, label))
+                with self._lock:
+                    self._results[index] = result
+
+        threads = list()
+        for _ in range(self.jobs):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        try:
+            for item in enumerate(rows):
+                inbox.put(item)
+
+        finally:
+            for _ in threads:
+                inbox.put(None)
+
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+
+        return self.results()
+
+
+class Pipeline(object):
+    """Pass rows through consecutive stages, each with its own bounded pool.
+
+    A row enters the next stage as soon as it leaves the previous one, so
+    for example downloads of one project overlap with uploads of another.
+    Queues between stages are bounded by the size of the receiving pool,
+    which limits how much work (and temporary disk space) piles up in front
+    of a slow stage. A row that fails in a stage does not enter later
+    stages, nor does a row for which a stage returns :data:`SKIPPED`.
+
+    :param stages: ``(name, func, jobs)`` tuples in execution order
+    :type stages: list of tuple
+
+    Example::
+
+      pipeline = Pipeline([('fetch', fetch, 4), ('push', push, 2)])
+      results = pipeline.run(rows)
+    """
+
+    def __init__(self, stages):
+        self.stages = [(name, func, max(1, int(jobs or 1)))
+                       for name, func, jobs in stages]
+        self._results = dict()
+        self._lock = threading.Lock()
+
+    def results(self):
+        """the results of the rows that left the pipeline so far, in input
+        order
+
+        :rtype: list of :class:`JobResult`
+        """
+        with self._lock:
+            return [self._results[index] for index in sorted(self._results)]
+
+    def run(self, rows, label=None):
+        """Run all rows through the stages.
+
+        :param rows: iterable of rows, consumed lazily
+        :param label: optional callable returning the label of a row
+        :returns: results in input order, with per stage timings
+        :rtype: list of :class:`JobResult`
+        """
+        with self._lock:
+            self._results.clear()
+        inboxes = [queue.Queue(maxsize=jobs * 2) for _, _, jobs in self.stages]
+
+        def worker(position):
+            stagename, func, _ = self.stages[position]
+            while True:
+                item = inboxes[position].get()
+                if item is None:
+                    break
+                index, row, name, started, timings = item
+
+                _context.project = name
+                start = time.time()
+                try:
+                    value = func(row)
+
+                # pylint: disable=W0703
+                except Exception as err:
+                    timings[stagename] = time.time() - start
+                    log.error("%s failed: %s" % (stagename, err))
+                    with self._lock:
+                        self._results[index] = JobResult(name, False,
+                                                         time.time() - started,
+                                                         error=err, timings=timings)
+                    continue
+
+                finally:
+                    _context.project = None
+
+                timings[stagename] = time.time() - start
+                if value is not SKIPPED and position + 1 < len(self.stages):
+                    inboxes[position + 1].put(item)
+                else:
+                    with self._lock:
+                        self._results[index] = JobResult(name, True,
+                                                         time.time() - started,
+                                                         value=value, timings=timings)
+
+        pools = list()
+        for position, (_, _, jobs) in enumerate(self.stages):
+            threads = list()
+            for _ in range(jobs):
+                thread = threading.Thread(target=worker, args=(position,))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+            pools.append(threads)
+
+        try:
+            for index, row in enumerate(rows):
+                name = WorkerPool._label(row, label)
+                inboxes[0].put((index, row, name, time.time(), OrderedDict()))
+
+        finally:
+            # shut the stages down front to back so every row drains through
+            for position, threads in enumerate(pools):
+                for _ in threads:
+                    inboxes[position].put(None)
+
+                for thread in threads:
+                    while thread.is_alive():
+                        thread.join(0.5)
+
+        return self.results()
+
+
+class Background(object):
+    """Run a function in a thread while the caller does other work, e.g.
+    to fetch the next page of a listing while the current one is handled.
+    The call is attributed to the project of the calling thread.
+
+    :param func: callable without arguments
+
+    Example::
+
+      nextpage = Background(lambda: getpage(2))
+      handle(page)
+      page = nextpage.result()
+    """
+
+    def __init__(self, func):
+        self._value = None
+        self._error = None
+        project = current_project()
+
+        def target():
+            _context.project = project
+            try:
+                self._value = func()
+
+            # pylint: disable=W0703
+            except Exception as err:
+                self._error = err
+
+        self._thread = threading.Thread(target=target)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def result(self):
+        """wait for the call to finish
+
+        :returns: the return value of the function
+        :raises: the error raised by the function
+        """
+        while self._thread.is_alive():
+            self._thread.join(0.5)
+
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def concurrently(funcs, jobs=None):
+    """Call functions at the same time and return their return values.
+
+    Used for independent API calls, e.g. fetching the pages of a listing.
+    The calls are attributed to the project of the calling thread.
+
+    :param funcs: callables without arguments
+    :param jobs: maximum number of concurrent calls, defaults to one per
+                 function
+    :returns: the return values in the order of ``funcs``
+    :rtype: list
+    :raises: the first error raised by one of the calls, after all calls
+             finished
+    """
+    funcs = list(funcs)
+    project = current_project()
+    pool = WorkerPool(jobs or len(funcs))
+    results = pool.map(lambda func: func(), funcs, label=lambda func: project)
+    for result in results:
+        if not result.success:
+            raise result.error
+    return [result.value for result in results]
+
+
+def summarize(results, action="processed"):
+    """Log an aggregated success/failure summary of a run. Skipped projects
+    are counted separately and left out of the timings.
+
+    :param results: results as returned by :meth:`WorkerPool.map`
+    :param action: verb used in the summary line
+    :returns: the failed results
+    :rtype: list of :class:`JobResult`
+    """
+    failed = [x for x in results if not x.success]
+    skipped = [x for x in results if x.skipped]
+    log.info("%d projects %s, %d succeeded, %d skipped, %d failed" %
+             (len(results), action, len(results) - len(failed) - len(skipped),
+              len(skipped), len(failed)))
+
+    for result in results:
+        if not result.timings or result.skipped:
+            continue
+        stages = ", ".join(["%s %.1fs" % (stage, seconds)
+                            for stage, seconds in result.timings.items()])
+        log.info("  %s: %s, total %.1fs" % (result.name, stages, result.duration))
+
+    for result in failed:
+        log.error("  %s: %s" % (result.name, result.error))
+
+    return failed
@@ -0,0 +1,83 @@
+"""Tests of gltools.bundlechain and the IncrementalBundle step"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from gltools.git import Git
+from gltools.steps import IncrementalBundle
+from gltools.bundlechain import BundleChain, FULL, INCREMENTAL
+
+
+def git(*args):
+    env = dict(os.environ, GIT_AUTHOR_NAME='test', GIT_AUTHOR_EMAIL='test@example.com',
+               GIT_COMMITTER_NAME='test', GIT_COMMITTER_EMAIL='test@example.com')
+    return subprocess.check_output(('git',) + args, env=env).decode('ascii').strip()
+
+
+class IncrementalBundleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.repository = os.path.join(self.tempdir, 'project')
+        self.directory = os.path.join(self.tempdir, 'project.bundles')
+        git('init', '-q', self.repository)
+        git('-C', self.repository, 'checkout', '-q', '-b', 'master')
+        self.step = IncrementalBundle(os.path.join(self.repository, '.git'),
+                                      self.directory, 'project', chain=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def commit(self, message):
+        git('-C', self.repository, 'commit', '-q', '--allow-empty', '-m', message)
+
+    def export(self):
+        row = dict()
+        self.step.run(row, Git())
+        return row.get('bundle')
+
+    def chain(self):
+        return BundleChain(self.directory, 'project')
+
+    def test_rollover(self):
+        kinds = list()
+        for number in range(4):
+            self.commit('commit %d' % number)
+            self.export()
+            kinds.append(self.chain().bundles[-1]['type'])
+
+        self.assertEqual(kinds, [FULL, INCREMENTAL, INCREMENTAL, FULL])
+
+        chain = self.chain()
+        self.assertEqual(chain.sequence, 4)
+        self.assertEqual([x['file'] for x in chain.bundles], ['project-0004-full.bundle'])
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['manifest.json', 'project-0004-full.bundle'])
+
+    def test_unchanged_ref_writes_nothing(self):
+        self.commit('first')
+        self.assertEqual(self.export(), 'project-0001-full.bundle')
+        self.assertTrue(self.export() is None)
+        self.assertEqual(self.chain().sequence, 1)
+
+    def test_rewrite_starts_a_new_chain(self):
+        self.commit('first')
+        self.export()
+        self.commit('second')
+        self.export()
+        self.assertEqual(self.chain().bundles[-1]['type'], INCREMENTAL)
+
+        git('-C', self.repository, 'commit', '-q', '--amend', '--allow-empty',
+            '-m', 'rewritten')
+        self.assertEqual(self.export(), 'project-0003-full.bundle')
+
+        chain = self.chain()
+        self.assertEqual([x['type'] for x in chain.bundles], [FULL])
+        self.assertEqual(chain.tip, git('-C', self.repository, 'rev-parse', 'HEAD'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+"""Tests of the start up cost of gltools.cli"""
+
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# seconds importing gltools.cli may take, the interpreter start not included
+BUDGET = 0.5
+
+# modules only the commands themselves need
+LAZY = ['gitlab', 'requests', 'yaml', 'gltools.main']
+
+CHECK = """
+import sys, time, json
+start = time.time()
+import gltools.cli
+print(json.dumps({'seconds': time.time() - start,
+                  'loaded': sorted([x for x in %r if x in sys.modules])}))
+""" % LAZY
+
+
+def measure():
+    """import gltools.cli in a fresh interpreter"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([TOPDIR, env.get('PYTHONPATH', '')])
+    output = subprocess.check_output([sys.executable, '-c', CHECK], env=env,
+                                     cwd=TOPDIR)
+    return json.loads(output.decode('utf-8'))
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_heavy_modules_are_not_loaded(self):
+        self.assertEqual(measure()['loaded'], [])
+
+    def test_import_time_budget(self):
+        # the best of a few runs, the first one may pay for a cold disk cache
+        seconds = min([measure()['seconds'] for _ in range(3)])
+        self.assertTrue(seconds < BUDGET,
+                        "importing gltools.cli takes %.3fs, budget is %.3fs" %
+                        (seconds, BUDGET))
+
+
+if __name__ == '__main__':
+    unittest.main()
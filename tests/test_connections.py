@@ -0,0 +1,102 @@
+"""Tests of the retries and tracing of gltools.connections.SchedulingAdapter"""
+
+import time
+import unittest
+
+import gitlab
+import requests
+from requests.adapters import HTTPAdapter
+
+from gltools import tracing
+from gltools.connections import GitLab, SchedulingAdapter
+
+
+class SlowResponse(requests.Response):
+    """a response whose body takes a while to arrive"""
+
+    @property
+    def content(self):
+        time.sleep(0.2)
+        return b'body'
+
+
+class ScriptedAdapter(HTTPAdapter):
+    """answers with the status codes in ``statuses``, one per request"""
+
+    statuses = list()
+    sent = 0
+    response_class = requests.Response
+
+    def send(self, request, **kwargs):
+        response = self.response_class()
+        response.status_code = self.statuses[self.sent]
+        response.headers['Retry-After'] = '0'
+        response.request = request
+        response.url = request.url
+        response._content = b''
+        response._content_consumed = True
+        self.sent += 1
+        return response
+
+
+class Adapter(SchedulingAdapter, ScriptedAdapter):
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.sent = 0
+        SchedulingAdapter.__init__(self, retries=3)
+
+
+def send(adapter, method):
+    request = requests.Request(method, 'http://gitlab.example.com/api/v4/projects')
+    return adapter.send(request.prepare())
+
+
+class SchedulingAdapterTest(unittest.TestCase):
+
+    def test_too_many_requests_is_retried_for_post(self):
+        adapter = Adapter([429, 429, 201])
+        self.assertEqual(send(adapter, 'POST').status_code, 201)
+        self.assertEqual(adapter.sent, 3)
+
+    def test_server_error_is_not_retried_for_post(self):
+        adapter = Adapter([503, 201])
+        self.assertEqual(send(adapter, 'POST').status_code, 503)
+        self.assertEqual(adapter.sent, 1)
+
+    def test_server_error_is_retried_for_get(self):
+        adapter = Adapter([502, 200])
+        self.assertEqual(send(adapter, 'GET').status_code, 200)
+        self.assertEqual(adapter.sent, 2)
+
+    def test_retries_are_limited(self):
+        adapter = Adapter([429] * 5)
+        self.assertEqual(send(adapter, 'GET').status_code, 429)
+        self.assertEqual(adapter.sent, 4)
+
+    def test_traced_latency_includes_the_body(self):
+        adapter = Adapter([200])
+        adapter.response_class = SlowResponse
+        tracer = tracing.start()
+        try:
+            send(adapter, 'GET')
+        finally:
+            tracing.stop()
+
+        self.assertEqual(tracer.calls[0]['bytes'], 4)
+        self.assertTrue(tracer.calls[0]['seconds'] >= 0.2)
+
+
+class GitLabTest(unittest.TestCase):
+
+    def test_only_the_adapter_retries(self):
+        adapter = Adapter([429] * 20)
+        gl = GitLab('http://gitlab.example.com', private_token='secret')
+        gl.session.mount('http://', adapter)
+        with self.assertRaises(gitlab.exceptions.GitlabHttpError):
+            gl.http_request('get', '/projects')
+        self.assertEqual(adapter.sent, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Tests of gltools.localgitlab"""
+
+import unittest
+
+from gltools.localgitlab import GroupIndex
+from gltools.exceptions import GLToolsException
+
+
+class Group(object):
+
+    def __init__(self, id, full_path, full_name):
+        self.id = id
+        self.full_path = full_path
+        self.full_name = full_name
+        self.path = full_path.split('/')[-1]
+        self.name = full_name.split(' / ')[-1]
+
+
+class GroupIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = GroupIndex([Group(1, 'homenet', 'homenet'),
+                                 Group(2, 'homenet/roles', 'homenet / roles'),
+                                 Group(3, 'ansible/roles', 'ansible / roles')])
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup('homenet/roles').id, 2)
+        self.assertEqual(self.index.lookup(3).id, 3)
+        self.assertEqual(self.index.lookup('3').id, 3)
+        self.assertEqual(self.index.lookup('homenet / roles').id, 2)
+        self.assertTrue(self.index.lookup('missing') is None)
+
+    def test_ambiguous(self):
+        self.assertRaises(GLToolsException, self.index.lookup, 'roles')
+
+    def test_full_path_wins_over_path(self):
+        self.index.add(Group(4, 'homenet/homenet', 'homenet / homenet'))
+        self.assertEqual(self.index.lookup('homenet').id, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
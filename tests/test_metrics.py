@@ -0,0 +1,25 @@
+"""Tests of gltools.metrics"""
+
+import unittest
+
+from gltools.metrics import Metrics, FETCHED
+from gltools.workers import JobResult
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_row_observed_after_every_stage_counts_once(self):
+        metrics = Metrics('/nonexistent/glt.prom', 'sync', 'local', 'homenet')
+        row = {FETCHED: 1000}
+        metrics.observe('project', row)
+        metrics.observe('project', row)
+
+        lines = metrics.lines([JobResult('project', True, 1.0)])
+        self.assertTrue('gltools_project_fetched_bytes{command="sync",group="homenet",'
+                        'project="project",section="local"} 1000' in lines)
+        self.assertTrue('gltools_run_fetched_bytes{command="sync",group="homenet",'
+                        'section="local"} 1000' in lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Tests of gltools.runner"""
+
+import sys
+import time
+import unittest
+
+from gltools.runner import run
+from gltools.workers import WorkerPool, current_project
+from gltools.exceptions import GLToolsException
+
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+class RunTest(unittest.TestCase):
+
+    def test_capture(self):
+        lines = run(python("print('one'); print('two')"), capture=True)
+        self.assertEqual(lines, ['one', 'two'])
+
+    def test_failure_reports_the_tail(self):
+        code = "import sys\nfor x in range(50): print('line %d' % x)\nsys.exit(3)"
+        try:
+            run(python(code), tail=5)
+
+        except GLToolsException as err:
+            message = str(err)
+        else:
+            self.fail("no exception raised")
+
+        self.assertTrue("exited with 3" in message)
+        self.assertTrue("line 49" in message)
+        self.assertTrue("line 45" in message)
+        self.assertFalse("line 44" in message)
+
+    def test_timeout(self):
+        try:
+            run(python("import time; time.sleep(30)"), timeout=0.5)
+
+        except GLToolsException as err:
+            self.assertTrue("timed out" in str(err))
+        else:
+            self.fail("no exception raised")
+
+    def test_timeout_kills_the_children(self):
+        start = time.time()
+        self.assertRaises(GLToolsException, run,
+                          ['sh', '-c', 'sleep 15 & wait'], timeout=0.5)
+        self.assertTrue(time.time() - start < 5)
+
+    def test_consume_failure_is_not_a_timeout(self):
+        def consume(stream):
+            stream.read(1)
+            raise ValueError("bad archive")
+
+        try:
+            run(python("import time\nprint('x')\ntime.sleep(30)"),
+                consume=consume, timeout=20)
+
+        except GLToolsException as err:
+            self.assertTrue("bad archive" in str(err))
+            self.assertFalse("timed out" in str(err))
+        else:
+            self.fail("no exception raised")
+
+    def test_output_is_attributed_to_the_project(self):
+        seen = list()
+
+        def job(row):
+            run(python("import sys; print('out'); sys.stderr.write('err\\n')"),
+                callback=lambda line, stream: seen.append((stream, current_project())))
+
+        results = WorkerPool(jobs=1).map(job, [{'name': 'project'}])
+        self.assertTrue(results[0].success)
+        self.assertEqual(sorted(seen), [('stderr', 'project'), ('stdout', 'project')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""Tests of skipping unchanged projects in gltools.main.syncgroup"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from gltools.syncstate import SyncState
+from gltools.main.syncgroup import SyncGroup, SyncGroupLocal
+
+HEADS = {'refs/heads/master': 'a' * 40, 'refs/tags/v1': 'b' * 40}
+STAMP = '2020-01-01T00:00:00Z'
+
+
+class FakeGit(object):
+    """answers ls-remote and for-each-ref from dicts keyed by url and path"""
+
+    def __init__(self, remotes, local=None):
+        self.remotes = remotes
+        self.local = local or dict()
+
+    def ls_remote(self, url):
+        return dict(self.remotes.get(url, dict()))
+
+    def refs(self, path):
+        return dict(self.local.get(path, dict()))
+
+
+def command(cls, tempdir, git):
+    # the checks only need the state and git, not a gitlab configuration
+    obj = cls.__new__(cls)
+    obj.full = False
+    obj._git = git
+    obj._state = SyncState('src', 'dst', tempdir)
+    obj._state.record('project', STAMP, dict(HEADS))
+    return obj
+
+
+class SyncGroupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.row = {'name': 'project', 'path': 'project',
+                    'src_ssh_url_to_repo': 'src:project',
+                    'src_last_activity_at': STAMP,
+                    'ssh_url_to_repo': 'dst:project'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def sync(self, destination):
+        git = FakeGit({'src:project': HEADS, 'dst:project': destination})
+        return command(SyncGroup, self.tempdir, git)
+
+    def test_unchanged(self):
+        self.assertTrue(self.sync(HEADS).is_current(self.row))
+
+    def test_refs_added_on_the_destination_are_ignored(self):
+        destination = dict(HEADS, **{'refs/heads/local': 'c' * 40})
+        self.assertTrue(self.sync(destination).is_current(self.row))
+
+    def test_destination_drift(self):
+        self.assertFalse(self.sync(dict()).is_current(self.row))
+        moved = dict(HEADS, **{'refs/heads/master': 'c' * 40})
+        self.assertFalse(self.sync(moved).is_current(self.row))
+
+    def test_created_project_is_never_current(self):
+        self.row['created'] = True
+        self.assertFalse(self.sync(HEADS).is_current(self.row))
+
+    def test_source_activity(self):
+        self.row['src_last_activity_at'] = '2020-01-02T00:00:00Z'
+        self.assertFalse(self.sync(HEADS).is_current(self.row))
+
+
+class SyncGroupLocalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.row = {'name': 'project', 'path': 'project',
+                    'path_with_namespace': 'homenet/project',
+                    'ssh_url_to_repo': 'src:project',
+                    'last_activity_at': STAMP,
+                    'basedir': self.tempdir}
+        self.destination = SyncGroupLocal.destination(self.row)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def sync(self, local):
+        git = FakeGit({'src:project': HEADS}, {self.destination: local})
+        return command(SyncGroupLocal, self.tempdir, git)
+
+    def test_missing_destination(self):
+        self.assertFalse(self.sync(HEADS).is_current(self.row))
+
+    def test_destination_drift(self):
+        os.makedirs(self.destination)
+        open(os.path.join(self.destination, 'HEAD'), 'w').close()
+        self.assertTrue(self.sync(HEADS).is_current(self.row))
+        self.assertFalse(self.sync(dict()).is_current(self.row))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Tests of gltools.workers"""
+
+import time
+import unittest
+
+from gltools.workers import WorkerPool, Pipeline, SKIPPED, summarize
+
+
+def slow(row):
+    # the first rows take longest, so they finish last
+    time.sleep(0.05 * (5 - row['index']))
+    return row['index']
+
+
+def failing(row):
+    if row['name'] == 'broken':
+        raise ValueError("broken row")
+    return row['name']
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def test_results_in_input_order(self):
+        rows = [{'name': 'p%d' % x, 'index': x} for x in range(5)]
+        results = WorkerPool(jobs=5).map(slow, rows)
+        self.assertEqual([x.name for x in results], ['p0', 'p1', 'p2', 'p3', 'p4'])
+        self.assertEqual([x.value for x in results], [0, 1, 2, 3, 4])
+
+    def test_error_is_captured(self):
+        rows = [{'name': 'good'}, {'name': 'broken'}, {'name': 'other'}]
+        for jobs in (1, 3):
+            results = WorkerPool(jobs=jobs).map(failing, rows)
+            self.assertEqual([x.success for x in results], [True, False, True])
+            self.assertTrue(isinstance(results[1].error, ValueError))
+            self.assertEqual(results[2].value, 'other')
+
+    def test_results_of_an_interrupted_run(self):
+        def rows():
+            yield {'name': 'first'}
+            raise RuntimeError("listing failed")
+
+        pool = WorkerPool(jobs=1)
+        self.assertRaises(RuntimeError, pool.map, failing, rows())
+        self.assertEqual([x.name for x in pool.results()], ['first'])
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_failed_row_skips_later_stages(self):
+        pushed = list()
+        pipeline = Pipeline([('fetch', failing, 2),
+                             ('push', lambda row: pushed.append(row['name']), 1)])
+        results = pipeline.run([{'name': 'good'}, {'name': 'broken'}])
+
+        self.assertEqual(pushed, ['good'])
+        self.assertEqual([x.success for x in results], [True, False])
+        self.assertEqual(list(results[0].timings), ['fetch', 'push'])
+        self.assertEqual(list(results[1].timings), ['fetch'])
+
+    def test_skipped_row_leaves_the_pipeline(self):
+        pushed = list()
+
+        def fetch(row):
+            if row['name'] == 'current':
+                return SKIPPED
+
+        pipeline = Pipeline([('fetch', fetch, 1),
+                             ('push', lambda row: pushed.append(row['name']), 1)])
+        results = pipeline.run([{'name': 'changed'}, {'name': 'current'}])
+
+        self.assertEqual(pushed, ['changed'])
+        self.assertEqual([x.skipped for x in results], [False, True])
+        self.assertEqual(summarize(results, "synced"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()